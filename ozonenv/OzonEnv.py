@@ -1,9 +1,17 @@
+import asyncio
 import logging
 import os
+from contextlib import asynccontextmanager
 
 from ozonenv.core.BaseModels import BasicReturn
 from ozonenv.core.OzonClient import OzonClient
 from ozonenv.core.OzonOrm import OzonEnvBase, OzonModel
+from ozonenv.core.db.mongodb_utils import (
+    connect_to_mongo,
+    close_mongo_connection,
+    DbSettings,
+    Mongo,
+)
 
 logger = logging.getLogger(__file__)
 
@@ -128,3 +136,136 @@ class OzonWorkerEnv(OzonEnv):
             url=os.getenv("OZON_CLIENT", "http://client:8526")
         )
         return self.default_response(msg="Done")
+
+
+class OzonEnvPool:
+    def __init__(
+            self,
+            cls_env=OzonWorkerEnv,
+            size=1,
+            cfg={},
+            upload_folder="",
+            cls_model=OzonModel,
+            local_model={},
+            use_cache=False,
+            cache_idx="ozon_env",
+            redis_url="redis://redis_cache",
+            watch_changes=False):
+        """
+        Pool of long-lived env, the Motor client, the orm and the models
+        are built once and kept warm, for each job only the session
+        (params, token, user_session) is reset, the buffered updates are
+        written and the model options changed by the previous job
+        (versioned, trusted_read, write_profile, write buffer) are
+        restored, see OzonModelBase.reset_options.
+
+        :param cls_env: the env class to pool, eg. a OzonWorkerEnv subclass
+        :param size: max number of env alive at the same time
+        :param watch_changes: keep models and settings of the env up to date
+                              with a change stream, require a replica set;
+                              one stream is shared by all the env
+        """
+        self.cls_env = cls_env
+        self.size = size
+        self.cfg = cfg.copy()
+        self.upload_folder = upload_folder
+        self.cls_model = cls_model
+        self.local_model = local_model
+        self.use_cache = use_cache
+        self.cache_idx = cache_idx
+        self.redis_url = redis_url
+        self.watch_changes = watch_changes
+        self.db: Mongo = None
+        self.connect_lock = asyncio.Lock()
+        self.watcher_task: asyncio.Task = None
+        self.envs: list[OzonEnvBase] = []
+        self.idle: asyncio.LifoQueue = asyncio.LifoQueue()
+
+    def new_env(self) -> OzonEnvBase:
+        env = self.cls_env(
+            cfg=self.cfg, upload_folder=self.upload_folder,
+            cls_model=self.cls_model)
+        env.persistent = True
+        env.use_cache = self.use_cache
+        env.cache_index = self.cache_idx
+        env.redis_url = self.redis_url
+        return env
+
+    async def connect(self, env: OzonEnvBase):
+        # the first envs are created concurrently, connect only once
+        async with self.connect_lock:
+            if not self.db:
+                self.db = await connect_to_mongo(
+                    DbSettings(**env.config_system))
+
+    async def get_env(self) -> OzonEnvBase:
+        if self.idle.empty() and len(self.envs) < self.size:
+            env = self.new_env()
+            self.envs.append(env)
+            try:
+                await self.connect(env)
+                await env.init_env(db=self.db, local_model=self.local_model)
+                if self.watch_changes:
+                    self.start_watcher(env)
+            except Exception:
+                self.envs.remove(env)
+                raise
+            return env
+        return await self.idle.get()
+
+    def start_watcher(self, env: OzonEnvBase):
+        # a single change stream of the pool db for all the env
+        if not self.watcher_task:
+            self.watcher_task = asyncio.create_task(
+                env.orm.watch_changes(self.notify_change))
+
+    async def stop_watcher(self):
+        if self.watcher_task:
+            self.watcher_task.cancel()
+            try:
+                await self.watcher_task
+            except asyncio.CancelledError:
+                pass
+            self.watcher_task = None
+
+    async def notify_change(self, change: dict):
+        for env in list(self.envs):
+            if not env.env_ready:
+                continue
+            try:
+                await env.orm.on_change(change)
+            except Exception as e:
+                logger.exception(e)
+
+    def release_env(self, env: OzonEnvBase):
+        if env.env_ready:
+            self.idle.put_nowait(env)
+        elif env in self.envs:
+            self.envs.remove(env)
+
+    @asynccontextmanager
+    async def acquire(self):
+        env = await self.get_env()
+        try:
+            yield env
+        finally:
+            self.release_env(env)
+
+    async def make_app_session(self, params: dict) -> BasicReturn:
+        async with self.acquire() as env:
+            return await env.make_app_session(
+                params, use_cache=self.use_cache, cache_idx=self.cache_idx,
+                redis_url=self.redis_url, db=self.db,
+                local_model=self.local_model)
+
+    async def close(self):
+        await self.stop_watcher()
+        while not self.idle.empty():
+            self.idle.get_nowait()
+        for env in self.envs:
+            env.persistent = False
+            await env.close_env()
+        self.envs = []
+        if self.db:
+            await close_mongo_connection()
+            self.db = None
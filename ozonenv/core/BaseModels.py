@@ -8,21 +8,30 @@ import logging
 import operator
 import re
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import date, datetime
 from functools import reduce
-from typing import Any
+from typing import Any, Callable
 from typing import Optional
 from typing import TypeVar, Generic, List, Dict
+from typing import get_args
+from weakref import WeakKeyDictionary
 
 import typing_extensions
 
 # from datetime import datetime
-from dateutil.parser import parse
-from pydantic import BaseModel, Field, field_serializer
+from pydantic import (
+    BaseModel,
+    Field,
+    PrivateAttr,
+    TypeAdapter,
+    field_serializer,
+)
 from typing_extensions import Literal
 
 import ozonenv
 from ozonenv.core.db.BsonTypes import BSON_TYPES_ENCODERS, PyObjectId, bson
+from ozonenv.core.exceptions import FieldNotLoaded
+from ozonenv.core.utils import parse_datetime
 
 IncEx: typing_extensions.TypeAlias = (
     'set[int] | set[str] | dict[int, Any] | ' 'dict[str, Any] | None'
@@ -245,7 +254,9 @@ class MainModel(BaseModel):
         )
 
         if isinstance(res, dict) and compute_data:
-            res = self.compute_datetime_fields(res, parse(defaultdt), '')
+            res = self.compute_datetime_fields(
+                res, parse_datetime(defaultdt), ''
+            )
         return res
 
     def get_dict(self, exclude=None, compute_datetime: bool = True):
@@ -335,12 +346,17 @@ class MainModel(BaseModel):
     def selection_value(self, key, value, read_value):
         setattr(self, key, value)
         self.data_value[key] = read_value
+        self.mark_dirty("data_value")
 
     def selection_value_from_record(self, key, src, src_key=""):
         if not src_key:
             src_key = key
         setattr(self, key, getattr(src, src_key))
         self.data_value[key] = src.data_value[src_key]
+        self.mark_dirty("data_value")
+
+    def mark_dirty(self, *fields):
+        pass
 
     model_config = {
         "populate_by_name": True,
@@ -351,6 +367,101 @@ class MainModel(BaseModel):
     }
 
 
+def _annotation_types(annotation) -> set:
+    types = set()
+    for arg in get_args(annotation) or (annotation,):
+        if get_args(arg):
+            types |= _annotation_types(arg)
+        elif isinstance(arg, type):
+            types.add(arg)
+    return types
+
+
+def trusted_converter(annotation) -> Optional[Callable]:
+    """
+    :return: the conversion of a db value to the annotation type used by
+             CoreModel.model_construct_trusted, None if the db value is
+             already of the annotation type
+    """
+    types = _annotation_types(annotation)
+    if any(issubclass(t, BaseModel) for t in types):
+        return TypeAdapter(annotation).validate_python
+    if datetime in types:
+        return datetime.fromisoformat
+    if date in types:
+        return date.fromisoformat
+    return None
+
+
+@dataclass
+class TrustedPlan:
+    """
+    how to build the records of a model class without the validation,
+    see CoreModel.model_construct_trusted
+    """
+
+    names: frozenset
+    aliases: dict
+    defaults: dict
+    mutable_defaults: list
+    default_factories: dict
+    converters: dict
+    private: dict
+    model: type[BaseModel]
+    # field name: TypeAdapter, built on first use, see validate_field
+    adapters: dict
+
+    @classmethod
+    def from_model(cls, model: type[BaseModel]) -> "TrustedPlan":
+        plan = cls(
+            names=frozenset(model.model_fields),
+            aliases={},
+            defaults={},
+            mutable_defaults=[],
+            default_factories={},
+            converters={},
+            private=model.__private_attributes__,
+            model=model,
+            adapters={},
+        )
+        for name, field in model.model_fields.items():
+            converter = trusted_converter(field.annotation)
+            if converter:
+                plan.converters[name] = converter
+            if field.alias and field.alias != name:
+                plan.aliases[field.alias] = name
+            if field.default_factory is not None:
+                plan.default_factories[name] = field.default_factory
+                continue
+            if field.is_required():
+                continue
+            default = field.default
+            plan.defaults[name] = default
+            if isinstance(default, (list, dict, set)):
+                plan.mutable_defaults.append(name)
+        return plan
+
+    def validate_field(self, name: str, value: Any) -> Any:
+        """
+        validate the value of a single field, the other fields of the
+        model are not required
+        """
+        adapter = self.adapters.get(name)
+        if adapter is None:
+            field = self.model.model_fields[name]
+            annotation = field.annotation
+            if field.metadata:
+                annotation = typing_extensions.Annotated[
+                    (annotation, *field.metadata)
+                ]
+            adapter = self.adapters[name] = TypeAdapter(annotation)
+        return adapter.validate_python(value)
+
+
+# model class: TrustedPlan
+trusted_plans: WeakKeyDictionary = WeakKeyDictionary()
+
+
 class CoreModel(MainModel):
     id: PyObjectId = Field(
         default_factory=ozonenv.core.db.BsonTypes.PyObjectId, alias="_id"
@@ -374,6 +485,7 @@ class CoreModel(MainModel):
     owner_personal_type: str = ""
     owner_job_title: str = ""
     update_uid: str = ""
+    doc_version: int = 0
     sys: bool = False
     default: bool = False
     active: bool = True
@@ -384,6 +496,142 @@ class CoreModel(MainModel):
     status: str = "ok"
     message: str = ""
     res_data: dict = Field(default={})
+    # fields assigned since the record was loaded, None if not tracked
+    _dirty: Optional[set] = PrivateAttr(default=None)
+    # doc_version of the stored document, None if not read from db
+    _stored_version: Optional[int] = PrivateAttr(default=None)
+    # copy of the container values when the tracking started
+    _snapshot: Optional[dict] = PrivateAttr(default=None)
+
+    def __setattr__(self, name, value):
+        private = self.__pydantic_private__
+        if (
+            private
+            and private.get("_dirty") is not None
+            and name in self.__class__.model_fields
+        ):
+            private["_dirty"].add(name)
+        super().__setattr__(name, value)
+
+    def __getattr__(self, name):
+        # the fields are in __dict__, a missing one was not loaded
+        if name in self.__class__.model_fields:
+            raise FieldNotLoaded(name, self.__class__.__name__)
+        return super().__getattr__(name)
+
+    def set_loaded_fields(self, fields: set):
+        """
+        make the record partial keeping only the loaded fields, the other
+        fields raise FieldNotLoaded and are not dumped
+        """
+        for name in self.__class__.model_fields:
+            if name not in fields:
+                self.__dict__.pop(name, None)
+        self.__pydantic_fields_set__ &= fields
+
+    def track_changes(self):
+        """
+        start tracking the assigned fields, called by the model on the
+        records loaded from db; see get_dirty_fields
+        """
+        self._dirty = set()
+        self._stored_version = self.doc_version
+        self._snapshot = {
+            name: copy.deepcopy(value)
+            for name, value in self.__dict__.items()
+            if isinstance(value, (list, dict, set, BaseModel))
+            and name in self.__class__.model_fields
+        }
+
+    def set_stored_version(self, doc_version: int):
+        """
+        set the doc_version of the stored document the record replaces,
+        see get_stored_version
+        """
+        self._stored_version = doc_version or 0
+
+    def get_stored_version(self) -> Optional[int]:
+        """
+        :return: the doc_version of the stored document when the record
+                 was read from db, None for the records built with new
+        """
+        return self._stored_version
+
+    def mark_dirty(self, *fields):
+        """
+        mark as changed the fields modified in place,
+        eg. record.tipologia.append("c")
+        """
+        if self._dirty is not None:
+            self._dirty.update(fields)
+
+    def get_dirty_fields(self) -> Optional[set]:
+        """
+        :return: the fields assigned since track_changes and the
+                 containers changed in place, None if the record is not
+                 tracked
+        """
+        if self._dirty is None:
+            return None
+        return self._dirty | {
+            name
+            for name, value in (self._snapshot or {}).items()
+            if name in self.__dict__ and self.__dict__[name] != value
+        }
+
+    @classmethod
+    def model_construct_trusted(cls, data: dict, partial=False) -> "CoreModel":
+        """
+        build the record from a document read from db without the
+        validation, the document was validated on write: only the
+        datetime, date and nested model fields are converted.
+        The record is validated if a value is not in the stored format.
+        :param partial: data has only some fields of the model (a
+                        projection), only these fields are validated
+        """
+        plan = trusted_plans.get(cls)
+        if plan is None:
+            plan = trusted_plans[cls] = TrustedPlan.from_model(cls)
+        values = plan.defaults.copy()
+        fields_set = set(plan.names.intersection(data))
+        for alias, name in plan.aliases.items():
+            if alias in data and name not in fields_set:
+                values[name] = data[alias]
+                fields_set.add(name)
+        for name in fields_set:
+            if name in data:
+                values[name] = data[name]
+        try:
+            for name, converter in plan.converters.items():
+                value = values.get(name)
+                if name in fields_set and isinstance(value, (str, dict, list)):
+                    values[name] = converter(value)
+        except (ValueError, TypeError):
+            if not partial:
+                return cls(**data)
+            for name in fields_set:
+                values[name] = plan.validate_field(name, values[name])
+        for name in plan.mutable_defaults:
+            if name not in fields_set:
+                default = values[name]
+                if default:
+                    values[name] = copy.deepcopy(default)
+                else:
+                    values[name] = default.copy()
+        for name, factory in plan.default_factories.items():
+            if name not in fields_set:
+                values[name] = factory()
+        # as BaseModel.model_construct
+        record = cls.__new__(cls)
+        object.__setattr__(record, "__dict__", values)
+        object.__setattr__(record, "__pydantic_fields_set__", fields_set)
+        object.__setattr__(record, "__pydantic_extra__", None)
+        object.__setattr__(
+            record,
+            "__pydantic_private__",
+            {k: v.get_default() for k, v in plan.private.items()},
+        )
+        return record
 
     @field_serializer('id')
     def serialize_dt(self, id: PyObjectId, _info):
@@ -483,7 +731,7 @@ class CoreModel(MainModel):
     def to_datetime(self, key):
         v = self.get(key)
         try:
-            return parse(v)
+            return parse_datetime(v)
         except Exception:
             return v
 
@@ -684,7 +932,7 @@ class DictRecord(BaseModel):
         regex_dt = re.compile(r"(\d{4}-\d{2}-\d{2})[A-Z]+(\d{2}:\d{2}:\d{2})")
         dtr = regex_dt.search(s)
         if dtr:
-            return parse(dtr.group(0))
+            return parse_datetime(dtr.group(0))
         else:
             rgx = regex.search(s)
             if not rgx:
@@ -818,7 +1066,7 @@ class DictRecord(BaseModel):
     def to_date(self, key):
         v = self.get(key)
         if self.value_type(v) is datetime:
-            return parse(v)
+            return parse_datetime(v)
         return v
 
     def clone_data(self):
@@ -834,6 +1082,43 @@ class BasicReturn(BaseModel):
     data: dict = {}
 
 
+class BulkError(BaseModel):
+    index: int
+    rec_name: str = ""
+    error_type: str = ""
+    key: str = ""
+    value: Any = None
+    msg: str = ""
+
+
+class BulkReturn(BaseModel):
+    fail: bool = False
+    msg: str = ""
+    inserted: int = 0
+    matched: int = 0
+    modified: int = 0
+    deleted: int = 0
+    errors: list[BulkError] = []
+    records: list = []
+
+
+class PageReturn(BaseModel):
+    fail: bool = False
+    msg: str = ""
+    records: list = []
+    # the token of the next page, empty on the last page
+    cursor: str = ""
+
+
+class ExplainReturn(BaseModel):
+    fail: bool = False
+    msg: str = ""
+    plan: dict = {}
+    stages: list[str] = []
+    indexes: list[str] = []
+    index_used: bool = False
+
+
 class Settings(BasicModel):
     list_order: Optional[int] = Field(0, title='List Order')
     rec_name: Optional[str] = Field('', title='Rec Name')
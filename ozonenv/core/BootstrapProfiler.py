@@ -0,0 +1,77 @@
+import time as time_
+from contextlib import contextmanager, nullcontext
+from typing import Callable
+
+
+class BootstrapProfiler:
+    """
+    Record the duration of the env bootstrap phases (db connection,
+    translations, settings, models build, code generation, session).
+    Durations are formatted by the env formatter
+    (OzonEnvBase.get_formatted_metrics) and collected in report().
+    """
+
+    enabled = True
+
+    def __init__(self, formatter: Callable[[float], str]):
+        self.formatter = formatter
+        self.start_time = time_.monotonic()
+        self.phases: dict[str, str] = {}
+        self.models: dict[str, str] = {}
+        self.codegen: dict[str, str] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start_time = time_.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.formatter(start_time)
+
+    @contextmanager
+    def model(self, name: str):
+        start_time = time_.monotonic()
+        try:
+            yield
+        finally:
+            self.models[name] = self.formatter(start_time)
+
+    @contextmanager
+    def model_code(self, name: str):
+        start_time = time_.monotonic()
+        try:
+            yield
+        finally:
+            self.codegen[name] = self.formatter(start_time)
+
+    def report(self) -> dict:
+        return {
+            "total": self.formatter(self.start_time),
+            "phases": self.phases.copy(),
+            "models": self.models.copy(),
+            "codegen": self.codegen.copy(),
+        }
+
+
+class NullProfiler:
+    """
+    Profiler used when the bootstrap profile is disabled, record nothing.
+    """
+
+    enabled = False
+    null_context = nullcontext()
+
+    def phase(self, name: str):
+        return self.null_context
+
+    def model(self, name: str):
+        return self.null_context
+
+    def model_code(self, name: str):
+        return self.null_context
+
+    def report(self) -> dict:
+        return {}
+
+
+null_profiler = NullProfiler()
@@ -8,7 +8,6 @@ import re
 from datetime import datetime
 from typing import List, Any
 
-from json_logic import jsonLogic
 from pydantic import create_model
 
 from ozonenv.core.BaseModels import BasicModel, BaseModel, MainModel, defaultdt
@@ -294,6 +293,8 @@ class Component:
 
     def aval_conditional(self):
         if self.raw.get("conditional").get("json"):
+            from json_logic import jsonLogic
+
             json_logic = self.raw.get("conditional").get("json")
             self._find_logic_rel_fields(json_logic)
             res = not jsonLogic(json_logic, self.builder.context_data)
@@ -303,6 +304,8 @@ class Component:
         data = is_json(act_value)
         if not data:
             return act_value
+        from json_logic import jsonLogic
+
         self._find_logic_rel_fields(data)
         logic_data = jsonLogic(data, self.builder.context_data)
         return logic_data
@@ -335,6 +338,8 @@ class Component:
                 self.properties[key] = self.cfg[key]
 
     def compute_logic(self, json_logic, actions):
+        from json_logic import jsonLogic
+
         logic_res = jsonLogic(json_logic, self.builder.context_data)
         # logger.info(f"comupte json_logic--> {json_logic}  -> {logic_res}")
         if logic_res:
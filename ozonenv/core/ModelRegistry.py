@@ -0,0 +1,68 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from ozonenv.core.BaseModels import BasicModel
+from ozonenv.core.ModelMaker import ModelMaker
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RegistryItem:
+    name: str
+    version: str
+    model: type[BasicModel]
+    # the ModelMaker built from the formio schema, None if the model was
+    # imported from the generated module
+    mm: Optional[ModelMaker] = None
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of the compiled model classes.
+    An item is stored for a namespace (the models folder of the env) and is
+    valid only for the component version (update_datetime) it was built
+    from, so a new env can attach the already built class without
+    rebuilding or re-importing it.
+    """
+
+    def __init__(self):
+        self.items: dict[tuple[str, str], RegistryItem] = {}
+
+    def get(
+        self, namespace: str, name: str, version: str = ""
+    ) -> Optional[RegistryItem]:
+        """
+        :param namespace: the models folder of the env
+        :param name: the model name (component rec_name)
+        :param version: if set return the item only if built for
+                        this version
+        :return: RegistryItem or None
+        """
+        item = self.items.get((namespace, name))
+        if item and version and not item.version == version:
+            return None
+        return item
+
+    def register(
+        self,
+        namespace: str,
+        name: str,
+        version: str,
+        model: type[BasicModel],
+        mm: ModelMaker = None,
+    ) -> RegistryItem:
+        item = RegistryItem(name=name, version=version, model=model, mm=mm)
+        self.items[(namespace, name)] = item
+        logger.debug(f"register model {name} version {version}")
+        return item
+
+    def remove(self, namespace: str, name: str):
+        self.items.pop((namespace, name), None)
+
+    def clear(self):
+        self.items.clear()
+
+
+model_registry = ModelRegistry()
@@ -3,7 +3,6 @@ import logging
 from datetime import date, datetime
 
 import aiofiles
-import httpx
 
 logger = logging.getLogger("asyncio")
 
@@ -15,6 +14,13 @@ def json_serial(obj):
         return obj.isoformat()
 
 
+def http_client(**kwargs):
+    """httpx is imported on first use"""
+    import httpx
+
+    return httpx.AsyncClient(**kwargs)
+
+
 class OzonClient:
     @classmethod
     def create(cls, apikey, is_api=False, url="http://client:8526"):
@@ -45,7 +51,7 @@ class OzonClient:
         }
         headers = self.get_headers()
         result = {"status": "ok"}
-        async with httpx.AsyncClient(timeout=None) as client:
+        async with http_client(timeout=None) as client:
             res = await client.post(url, json=data_obj, headers=headers)
             if res:
                 res = res.json()
@@ -84,7 +90,7 @@ class OzonClient:
         data_obj = {}
         headers = self.get_headers()
         result = {"status": "ok"}
-        async with httpx.AsyncClient(timeout=None) as client:
+        async with http_client(timeout=None) as client:
             res = await client.post(url, json=data_obj, headers=headers)
             if res:
                 res = res.json()
@@ -107,7 +113,7 @@ class OzonClient:
             data = await f.read()
             file_list.append((f_todo['file_key'], (f_todo['file_name'], data)))
             await f.close()
-        client = httpx.AsyncClient(timeout=120)
+        client = http_client(timeout=120)
         return await client.post(
             url,
             files=file_list,
@@ -120,7 +126,7 @@ class OzonClient:
         )
 
     async def post_form_data(self, url, headers, form_data={}):
-        client = httpx.AsyncClient(timeout=90)
+        client = http_client(timeout=90)
         return await client.post(
             url,
             data={
@@ -178,7 +184,7 @@ class OzonClient:
             f"copy/{model}/{rec_name}/{field}/{dest}"
         )
         headers = self.get_headers()
-        async with httpx.AsyncClient(timeout=None) as client:
+        async with http_client(timeout=None) as client:
             res = await client.post(url, json={}, headers=headers)
             if res:
                 return res
@@ -198,7 +204,7 @@ class OzonClient:
         }
         headers = self.get_headers()
         result = {"status": "ok"}
-        async with httpx.AsyncClient(timeout=None) as client:
+        async with http_client(timeout=None) as client:
             res = await client.post(url, json=data_obj, headers=headers)
             if res:
                 res = res.json()
@@ -240,7 +246,7 @@ class LabelPrinter:
         headers = self.get_headers()
 
         try:
-            async with httpx.AsyncClient(timeout=None) as client:
+            async with http_client(timeout=None) as client:
                 resp = await client.get(url, headers=headers)
                 return resp.json()
         except Exception as e:
@@ -253,7 +259,7 @@ class LabelPrinter:
         headers = self.get_headers()
 
         try:
-            async with httpx.AsyncClient(timeout=None) as client:
+            async with http_client(timeout=None) as client:
                 resp = await client.post(url, json=payload, headers=headers)
                 return resp.json()
         except Exception as e:
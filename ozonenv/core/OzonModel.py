@@ -1,18 +1,23 @@
 import copy
-import json
 import locale
 import logging
 import re
+import time
 import uuid
 from datetime import datetime, timedelta
-from typing import Any, Union
+from typing import Any, AsyncIterator, Union
 
 import bson
 import pydantic
 import pymongo
-from dateutil.parser import parse
 from pydantic._internal._model_construction import ModelMetaclass
-from pymongo.errors import DuplicateKeyError, OperationFailure
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import (
+    BulkWriteError,
+    DuplicateKeyError,
+    OperationFailure,
+    PyMongoError,
+)
 
 from ozonenv.core.BaseModels import (
     Component,
@@ -20,16 +25,40 @@ from ozonenv.core.BaseModels import (
     CoreModel,
     Settings,
     BasicReturn,
+    BulkError,
+    BulkReturn,
     DictRecord,
+    ExplainReturn,
+    PageReturn,
     default_list_metadata,
     default_list_metadata_fields_update,
     defaultdt,
 )
 from ozonenv.core.ModelMaker import ModelMaker
-from ozonenv.core.db.BsonTypes import JsonEncoder
-from ozonenv.core.exceptions import SessionException
+from ozonenv.core.ModelRegistry import model_registry
+from ozonenv.core.WriteBuffer import WriteBuffer
+from ozonenv.core.cache.session_cache import session_cache
+from ozonenv.core.db.BsonTypes import bson_to_python
+from ozonenv.core.db.QueryLog import (
+    index_stages,
+    plan_summary,
+    query_log,
+    winning_plan,
+)
+from ozonenv.core.db.mongodb_utils import (
+    counters_collection,
+    get_path_value,
+    keyset_domain,
+    make_page_token,
+    parse_page_token,
+    write_profiles,
+)
+from ozonenv.core.exceptions import (
+    SessionException,
+    VersionConflictException,
+)
 from ozonenv.core.i18n import _
-from ozonenv.core.utils import is_json
+from ozonenv.core.utils import is_json, parse_datetime
 
 logger = logging.getLogger(__name__)
 
@@ -99,6 +128,23 @@ class OzonMBase:
         self.form_disabled = False
         self.no_submit = False
         self.queryformeditable = {}
+        # reread the record after insert/update, if False update return
+        # the document from find_one_and_update and insert the saved record
+        self.reload_on_write = True
+        # update only if the record doc_version is the stored one,
+        # see OzonModelBase.update
+        self.versioned = False
+        # build the records read from db without the validation,
+        # see make_record
+        self.trusted_read = False
+        # write concern of the model writes, a write_profiles name,
+        # if empty the db default
+        self.write_profile = ""
+        self.collections = {}
+        # merge and delay the updates, see enable_write_buffer
+        self.write_buffer: WriteBuffer = None
+        # the options restored for a new session, see reset_options
+        self.default_options = {}
 
         self.init_schema_properties()
 
@@ -121,7 +167,15 @@ class OzonMBase:
                         self.queryformeditable = is_json(v)
 
     async def init_model(self):
-        self.mm = ModelMaker(self.name)
+        self.setup_model()
+
+    def setup_model(self):
+        item = model_registry.get(self.orm.models_path, self.name)
+        if self.static and item and item.mm and item.model is self.static:
+            # the metadata of the schema the registry model was built from
+            self.mm = item.mm
+        else:
+            self.mm = ModelMaker(self.name)
         if self.static:
             self.model: BasicModel = self.static
             self.tranform_data_value = self.model.tranform_data_value()
@@ -130,6 +184,27 @@ class OzonMBase:
             c_maker.model = Component
             c_maker.new()
             self.mm.from_formio(self.schema)
+        self.default_options = self.get_options()
+
+    def get_options(self) -> dict:
+        return {
+            "versioned": self.versioned,
+            "trusted_read": self.trusted_read,
+            "write_profile": self.write_profile,
+            "write_buffer": self.write_buffer,
+        }
+
+    def reset_options(self):
+        """
+        restore the options of the model as set up, a pooled env reuse
+        the model for the next session; the buffered updates must be
+        written before, see OzonEnvBase.make_app_session
+        """
+        buffer = self.default_options.get("write_buffer")
+        if self.write_buffer is not None and self.write_buffer is not buffer:
+            self.write_buffer.cancel_timer()
+        for name, value in self.default_options.items():
+            setattr(self, name, value)
 
     @classmethod
     def _value_type(cls, v):
@@ -185,7 +260,7 @@ class OzonMBase:
         if isinstance(val, str):
             try:
                 g = self.mm.regex_dt.search(val)
-                return parse(g.group(0)).strftime(
+                return parse_datetime(g.group(0)).strftime(
                     self.setting_app.ui_datetime_mask
                 )
             except Exception:
@@ -204,7 +279,7 @@ class OzonMBase:
 
     def _readable_date(self, val):
         if isinstance(val, str):
-            return parse(val).strftime(self.setting_app.ui_date_mask)
+            return parse_datetime(val).strftime(self.setting_app.ui_date_mask)
         else:
             return val.strftime(self.setting_app.ui_date_mask)
 
@@ -257,9 +332,24 @@ class OzonMBase:
             data = self.model.compute_datetime_fields(data, '', defaultdt)
         return data
 
-    def load_data(self, data):
+    def make_record(
+        self, data: dict, trusted=False, partial=False
+    ) -> CoreModel:
+        """
+        :param data: the record data
+        :param trusted: if True data is a document read from db and the
+                        record is built without the validation, see
+                        CoreModel.model_construct_trusted
+        :param partial: data is a projection of the document, the record
+                        is built as trusted
+        """
+        if trusted or partial:
+            return self.model.model_construct_trusted(data, partial)
+        return self.model(**data)
+
+    def load_data(self, data, trusted=False):
         if not self.virtual:
-            self.modelr = self.model(**data)
+            self.modelr = self.make_record(data, trusted)
         else:
             self.mm = ModelMaker(
                 self.data_model, fields_parser=self.virtual_fields_parser
@@ -306,6 +396,71 @@ class OzonModelBase(OzonMBase):
     def is_error(self):
         return self.status.fail
 
+    def chk_reload(self, reload: bool = None) -> bool:
+        if reload is None:
+            return self.reload_on_write
+        return reload
+
+    def chk_trusted(self, trusted: bool = None) -> bool:
+        if trusted is None:
+            return self.trusted_read
+        return trusted
+
+    def get_collection(self, write_profile: str = None):
+        """
+        :param write_profile: a write_profiles name (durable, fast,
+                              unacknowledged), default the model
+                              write_profile
+        :return: the model collection with the profile write concern
+        """
+        profile = write_profile or self.write_profile
+        if profile not in self.collections:
+            coll = self.db.engine.get_collection(self.data_model)
+            if profile:
+                if profile not in write_profiles:
+                    raise ValueError(_("Unknown write profile %s") % profile)
+                coll = coll.with_options(write_concern=write_profiles[profile])
+            self.collections[profile] = coll
+        return self.collections[profile]
+
+    def enable_write_buffer(self, max_size=500, flush_interval=1.0):
+        """
+        buffer the updates of the model, the fields of successive updates
+        of a record are merged and written in batch, see WriteBuffer.
+        update returns the record without writing it; versioned and
+        session models are not buffered.
+        :param max_size: flush when max_size records are pending
+        :param flush_interval: flush seconds after the first pending
+                               update, 0 only on size or flush_writes
+        the buffer is kept on the env by data_model and shared by the
+        models of the same collection, see OzonEnvBase.write_buffers
+        """
+        if self.write_buffer is None:
+            buffers = self.env.write_buffers
+            if self.data_model not in buffers:
+                buffers[self.data_model] = WriteBuffer(
+                    self, max_size=max_size, flush_interval=flush_interval
+                )
+            self.write_buffer = buffers[self.data_model]
+
+    async def disable_write_buffer(self):
+        await self.flush_writes()
+        buffer, self.write_buffer = self.write_buffer, None
+        if buffer is not None and not any(
+            model.write_buffer is buffer for model in self.env.models.values()
+        ):
+            self.env.write_buffers.pop(self.data_model, None)
+
+    async def flush_writes(self) -> BulkReturn:
+        """
+        write the updates buffered on the data model, by this or another
+        model of the env; called before the reads
+        """
+        buffer = self.env.write_buffers.get(self.data_model)
+        if buffer is None:
+            return BulkReturn()
+        return await buffer.flush()
+
     def get_domain(self, domain={}):
         _domain = self.default_domain.copy()
         _domain.update(domain)
@@ -385,8 +540,11 @@ class OzonModelBase(OzonMBase):
 
     async def count_by_filter(self, domain: dict) -> int:
         self.init_status()
+        await self.flush_writes()
         coll = self.db.engine.get_collection(self.data_model)
+        start_time = time.monotonic()
         val = await coll.count_documents(domain)
+        query_log.record(self.name, "count_by_filter", domain, start_time)
         if not val:
             val = 0
         return int(val)
@@ -399,6 +557,50 @@ class OzonModelBase(OzonMBase):
             domain = self.default_domain
         return await self.count_by_filter(domain)
 
+    async def reserve_list_order(self, size: int = 1) -> int:
+        """
+        reserve size consecutive list_order values from the data model
+        sequence with an atomic $inc.
+        :param size: the number of values to reserve
+        :return: the first reserved value
+        """
+        coll = self.db.engine.get_collection(counters_collection)
+        for i in range(2):
+            res = await coll.find_one_and_update(
+                {"_id": self.data_model},
+                {"$inc": {"seq": size}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if res:
+                return res["seq"] - size
+            await self.init_list_order_sequence()
+        raise OperationFailure(
+            f"list_order sequence of {self.data_model} not available"
+        )
+
+    async def init_list_order_sequence(self):
+        """
+        create the sequence of the data model starting after the max
+        list_order stored, if not exist.
+        """
+        coll = self.db.engine.get_collection(self.data_model)
+        last = await coll.find_one(
+            {}, projection={"list_order": 1}, sort=[("list_order", -1)]
+        )
+        seq = 0
+        if last and last.get("list_order") is not None:
+            seq = int(last["list_order"]) + 1
+        counters = self.db.engine.get_collection(counters_collection)
+        try:
+            await counters.update_one(
+                {"_id": self.data_model},
+                {"$setOnInsert": {"seq": seq}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # created by a concurrent writer
+            pass
+
     async def by_name(self, name: str) -> CoreModel:
         return await self.load({'rec_name': name})
 
@@ -526,11 +728,21 @@ class OzonModelBase(OzonMBase):
         self.load_data(data)
         self.modelr.set_active()
         if exist:
+            # the record replaces the stored one, see version_domain
+            self.modelr.set_stored_version(exist.doc_version)
             return await self.update(self.modelr)
         else:
             return await self.insert(self.modelr)
 
-    async def insert(self, record: CoreModel) -> Union[None, CoreModel]:
+    async def insert(
+        self, record: CoreModel, reload: bool = None, write_profile=None
+    ) -> Union[None, CoreModel]:
+        """
+        :param record: the record to save, see new
+        :param reload: if False return the saved record instead of reading
+                       it from db, default reload_on_write
+        :param write_profile: the write concern profile, see get_collection
+        """
         self.init_status()
         if not self.chk_write_permission():
             msg = _("Session is Readonly")
@@ -552,19 +764,26 @@ class OzonModelBase(OzonMBase):
                 self.error_status(msg, data=record.get_dict_json())
                 return None
 
-            coll = self.db.engine.get_collection(self.data_model)
+            coll = self.get_collection(write_profile)
+            reload = self.chk_reload(reload)
+            if not coll.write_concern.acknowledged:
+                reload = False
 
-            record.create_datetime = datetime.now().isoformat()
-            record = self.set_user_data(record, self.user_session)
-            record.list_order = await self.count()
-            record.active = True
-            to_save = self._make_from_dict(
-                record.get_dict(compute_datetime=False)
+            to_save = self.make_insert_doc(
+                record,
+                await self.reserve_list_order(),
+                datetime.now().isoformat(),
             )
-            if "_id" not in to_save:
-                to_save['_id'] = bson.ObjectId(to_save['id'])
             result = None
             result_save = await coll.insert_one(to_save)
+            if result_save and not reload:
+                record.create_datetime = datetime.fromisoformat(
+                    to_save["create_datetime"]
+                )
+                record.data_value = to_save.get("data_value", {})
+                record.track_changes()
+                self.modelr = record
+                return record
             if result_save:
                 return await self.load({"rec_name": to_save['rec_name']})
             self.error_status(
@@ -588,6 +807,315 @@ class OzonModelBase(OzonMBase):
             )
             return None
 
+    def make_insert_doc(
+        self, record: CoreModel, list_order: int, create_datetime: str
+    ) -> dict:
+        """
+        set the insert metadata on the record
+        :return: the document to insert
+        """
+        record.create_datetime = create_datetime
+        record = self.set_user_data(record, self.user_session)
+        record.list_order = list_order
+        record.active = True
+        to_save = self._make_from_dict(record.get_dict(compute_datetime=False))
+        if "_id" not in to_save:
+            to_save['_id'] = bson.ObjectId(to_save['id'])
+        return to_save
+
+    def get_update_fields(self, record: CoreModel, remove_mata=True) -> dict:
+        """
+        :param record: the record to update
+        :param remove_mata: exclude the metadata fields
+        :return: the fields changed since the record was loaded, all the
+                 record fields if the record is not tracked
+        """
+        fields = record.get_dirty_fields()
+        if fields is None:
+            fields = set(record.__class__.model_fields)
+        if remove_mata:
+            fields -= set(default_list_metadata_fields_update)
+        fields -= {"status", "message", "res_data", "doc_version"}
+        fields.discard("rec_name")
+        if not fields:
+            return {}
+        return record.model_dump(include=fields, compute_data=False)
+
+    async def insert_many(
+        self,
+        records: list[CoreModel],
+        ordered=False,
+        return_records=False,
+        write_profile=None,
+    ) -> BulkReturn:
+        """
+        insert the records with a single insert_many, the list_order values
+        are reserved once for the whole batch.
+        :param records: list of records, see new
+        :param ordered: if True the db stops at the first failed record
+        :param return_records: if True the inserted records are loaded
+                               in BulkReturn.records
+        :param write_profile: the write concern profile, see get_collection
+        :return: BulkReturn with the inserted count and the per record
+                 errors (not_allowed, validation, duplicate, db, skipped)
+        """
+        self.init_status()
+        if not self.chk_write_permission():
+            msg = _("Session is Readonly")
+            self.error_status(msg, data={})
+            return BulkReturn(fail=True, msg=msg)
+        if self.virtual and not self.data_model:
+            msg = _("Cannot save on db a virtual object")
+            self.error_status(msg, data={})
+            return BulkReturn(fail=True, msg=msg)
+        res = BulkReturn()
+        to_save_list = []
+        indexes = []
+        create_datetime = datetime.now().isoformat()
+        list_order = await self.reserve_list_order(len(records))
+        for i, record in enumerate(records):
+            rec_name = record.get("rec_name") or ""
+            if not rec_name or not self.name_allowed.match(rec_name):
+                res.errors.append(
+                    BulkError(
+                        index=i,
+                        rec_name=rec_name,
+                        error_type="not_allowed",
+                        msg=_("Not allowed chars in field name: %s")
+                        % rec_name,
+                    )
+                )
+                continue
+            try:
+                to_save = self.make_insert_doc(
+                    record, list_order + len(to_save_list), create_datetime
+                )
+            except pydantic.ValidationError as e:
+                logger.error(f" Validation {e}")
+                res.errors.append(
+                    BulkError(
+                        index=i,
+                        rec_name=rec_name,
+                        error_type="validation",
+                        msg=_("Validation Error  %s ") % str(e),
+                    )
+                )
+                continue
+            to_save_list.append(to_save)
+            indexes.append(i)
+        failed = set()
+        if to_save_list:
+            coll = self.get_collection(write_profile)
+            try:
+                result = await coll.insert_many(to_save_list, ordered=ordered)
+                res.inserted = len(result.inserted_ids)
+            except BulkWriteError as e:
+                res.inserted = e.details.get("nInserted", 0)
+                for err in e.details.get("writeErrors", []):
+                    failed.add(err["index"])
+                    res.errors.append(
+                        self._bulk_write_error(
+                            indexes[err["index"]], to_save_list, err
+                        )
+                    )
+                if ordered and failed:
+                    for pos in range(max(failed) + 1, len(to_save_list)):
+                        failed.add(pos)
+                        res.errors.append(
+                            BulkError(
+                                index=indexes[pos],
+                                rec_name=to_save_list[pos]["rec_name"],
+                                error_type="skipped",
+                                msg=_("Not inserted"),
+                            )
+                        )
+        res.errors.sort(key=lambda x: x.index)
+        if res.errors:
+            res.fail = True
+            res.msg = _("Inserted %s of %s records") % (
+                res.inserted,
+                len(records),
+            )
+        if return_records and res.inserted:
+            names = [
+                to_save["rec_name"]
+                for pos, to_save in enumerate(to_save_list)
+                if pos not in failed
+            ]
+            res.records = await self.find(
+                {"rec_name": {"$in": names}}, sort="list_order:asc"
+            )
+        return res
+
+    async def upsert_many(
+        self,
+        datas: list[dict],
+        key="rec_name",
+        return_records=False,
+        write_profile=None,
+    ) -> BulkReturn:
+        """
+        insert or update the records with a single bulk_write of
+        UpdateOne upsert, the record is matched by key; create_datetime,
+        list_order and owner fields are set only on insert.
+        :param datas: list of dict data, see upsert
+        :param key: the unique field used to match the existing record
+        :param return_records: if True the records are loaded
+                               in BulkReturn.records
+        :param write_profile: the write concern profile, see get_collection
+        :return: BulkReturn with inserted (upserted), matched and modified
+                 count and the per record errors
+        """
+        self.init_status()
+        if self.virtual and not self.data_model:
+            msg = _("Cannot update a virtual object")
+            self.error_status(msg, data={})
+            return BulkReturn(fail=True, msg=msg)
+        if not self.chk_write_permission():
+            msg = _("Session is Readonly")
+            self.error_status(msg, data={})
+            return BulkReturn(fail=True, msg=msg)
+        res = BulkReturn()
+        operations = []
+        docs = []
+        indexes = []
+        now = datetime.now().isoformat()
+        list_order = await self.reserve_list_order(len(datas))
+        insert_only = set(default_list_metadata_fields_update) | {
+            "_id",
+            "list_order",
+        }
+        insert_only.discard(key)
+        for i, data in enumerate(datas):
+            data = copy.deepcopy(data)
+            if key == "rec_name" and not data.get("rec_name"):
+                data["rec_name"] = f"{self.name}.{str(uuid.uuid4().hex)}"
+            rec_name = data.get("rec_name") or ""
+            if not data.get(key) or (
+                rec_name and not self.name_allowed.match(rec_name)
+            ):
+                res.errors.append(
+                    BulkError(
+                        index=i,
+                        rec_name=rec_name,
+                        error_type="not_allowed",
+                        key=key,
+                        value=data.get(key),
+                        msg=_("Not allowed chars in field name: %s")
+                        % rec_name,
+                    )
+                )
+                continue
+            try:
+                if not self.virtual:
+                    data = self._make_from_dict(self.decode_datetime(data))
+                self.load_data(data)
+                record = self.set_user_data(self.modelr, self.user_session)
+                record.set_active()
+                record.create_datetime = now
+                record.list_order = list_order + len(operations)
+                to_save = self._make_from_dict(
+                    record.get_dict(compute_datetime=False)
+                )
+            except pydantic.ValidationError as e:
+                logger.error(f" Validation {e}")
+                res.errors.append(
+                    BulkError(
+                        index=i,
+                        rec_name=rec_name,
+                        error_type="validation",
+                        msg=_("Validation Error  %s ") % str(e),
+                    )
+                )
+                continue
+            if "_id" not in to_save:
+                to_save['_id'] = bson.ObjectId(to_save['id'])
+            key_value = to_save.pop(key)
+            to_save.pop("doc_version", None)
+            set_on_insert = {
+                k: to_save.pop(k) for k in list(to_save) if k in insert_only
+            }
+            to_save["update_uid"] = self.orm.user_session.get("user.uid")
+            to_save["update_datetime"] = now
+            operations.append(
+                UpdateOne(
+                    {key: key_value},
+                    {
+                        "$set": to_save,
+                        "$setOnInsert": set_on_insert,
+                        "$inc": {"doc_version": 1},
+                    },
+                    upsert=True,
+                )
+            )
+            docs.append({"rec_name": rec_name, key: key_value})
+            indexes.append(i)
+        failed = set()
+        if operations:
+            coll = self.get_collection(write_profile)
+            try:
+                result = await coll.bulk_write(operations, ordered=False)
+                if result.acknowledged:
+                    res.inserted = result.upserted_count
+                    res.matched = result.matched_count
+                    res.modified = result.modified_count
+            except BulkWriteError as e:
+                res.inserted = e.details.get("nUpserted", 0)
+                res.matched = e.details.get("nMatched", 0)
+                res.modified = e.details.get("nModified", 0)
+                for err in e.details.get("writeErrors", []):
+                    failed.add(err["index"])
+                    res.errors.append(
+                        self._bulk_write_error(
+                            indexes[err["index"]], docs, err
+                        )
+                    )
+            if self.is_session_model:
+                await session_cache.invalidate_all(self.db.engine.name)
+        res.errors.sort(key=lambda x: x.index)
+        if res.errors:
+            res.fail = True
+            res.msg = _("Saved %s of %s records") % (
+                len(operations) - len(failed),
+                len(datas),
+            )
+        if return_records and len(failed) < len(operations):
+            keys = [
+                doc[key] for pos, doc in enumerate(docs) if pos not in failed
+            ]
+            res.records = await self.find(
+                {key: {"$in": keys}}, sort="list_order:asc"
+            )
+        return res
+
+    def _bulk_write_error(self, index, docs, err) -> BulkError:
+        """
+        :param index: the index of the record in the caller list
+        :param docs: the documents sent to the db
+        :param err: the writeErrors item of BulkWriteError
+        """
+        rec_name = docs[err["index"]].get("rec_name", "")
+        if err.get("code") == 11000:
+            field = err.get("keyValue") or {"": ""}
+            key = list(field.keys())[0]
+            val = field[key]
+            logger.error(f" Duplicate {err.get('errmsg')}")
+            return BulkError(
+                index=index,
+                rec_name=rec_name,
+                error_type="duplicate",
+                key=str(key),
+                value=val,
+                msg=_("Duplicate key error %s: %s") % (str(key), str(val)),
+            )
+        logger.error(f" Bulk write error {err.get('errmsg')}")
+        return BulkError(
+            index=index,
+            rec_name=rec_name,
+            error_type="db",
+            msg=str(err.get("errmsg", "")),
+        )
+
     async def copy(self, domain) -> Union[None, CoreModel]:
         self.init_status()
         if not self.chk_write_permission():
@@ -612,7 +1140,8 @@ class OzonModelBase(OzonMBase):
             self.modelr.rec_name = f"{self.modelr.rec_name}_copy"
         else:
             self.modelr.rec_name = f"{self.data_model}.{self.modelr.id}"
-        self.modelr.list_order = await self.count()
+        # the list_order is reserved by insert
+        self.modelr.list_order = 0
         self.modelr.create_datetime = datetime.now().isoformat()
         self.modelr.update_datetime = datetime.now().isoformat()
         record = await self.new(
@@ -626,8 +1155,21 @@ class OzonModelBase(OzonMBase):
         return record
 
     async def update(
-        self, record: CoreModel, remove_mata=True
+        self,
+        record: CoreModel,
+        remove_mata=True,
+        reload: bool = None,
+        write_profile=None,
     ) -> Union[None, CoreModel]:
+        """
+        :param record: the record to update
+        :param remove_mata: do not update the metadata fields
+        :param reload: if False return the document updated by
+                       find_one_and_update instead of reading it again,
+                       default reload_on_write
+        :param write_profile: the write concern profile, see get_collection;
+                              unacknowledged writes return the record
+        """
         self.init_status()
         if not self.chk_write_permission():
             msg = _("Session is Readonly")
@@ -638,10 +1180,25 @@ class OzonModelBase(OzonMBase):
                 _("Cannot update a virtual object"), record.get_dict_copy()
             )
             return None
+        if (
+            self.write_buffer is not None
+            and not self.virtual
+            and not self.versioned
+            and not self.is_session_model
+        ):
+            await self.write_buffer.add(
+                record, self.get_update_fields(record, remove_mata)
+            )
+            record.track_changes()
+            return record
         try:
-            coll = self.db.engine.get_collection(self.data_model)
-            original = await self.load(record.rec_name_domain())
-            if not self.virtual:
+            coll = self.get_collection(write_profile)
+            dirty = None if self.virtual else record.get_dirty_fields()
+            if dirty is None:
+                original = await self.load(record.rec_name_domain())
+            if dirty is not None:
+                to_save = self.get_update_fields(record, remove_mata)
+            elif not self.virtual:
                 _save = record.get_dict(compute_datetime=False)
                 to_save = original.get_dict_diff(
                     _save.copy(),
@@ -653,10 +1210,48 @@ class OzonModelBase(OzonMBase):
                 to_save = self._make_from_dict(copy.deepcopy(to_save))
             if "rec_name" in to_save:
                 to_save.pop("rec_name")
+            to_save.pop("doc_version", None)
             to_save["update_uid"] = self.orm.user_session.get("user.uid")
             to_save["update_datetime"] = datetime.now().isoformat()
-            await coll.update_one(record.rec_name_domain(), {"$set": to_save})
-            return await self.load(record.rec_name_domain())
+            domain = self.version_domain(record)
+            to_update = {"$set": to_save, "$inc": {"doc_version": 1}}
+            acknowledged = coll.write_concern.acknowledged
+            if not acknowledged:
+                await coll.update_one(domain, to_update)
+                updated = True
+            elif self.chk_reload(reload):
+                result = await coll.update_one(domain, to_update)
+                updated = result.matched_count > 0
+            else:
+                data = await coll.find_one_and_update(
+                    domain,
+                    to_update,
+                    return_document=ReturnDocument.AFTER,
+                )
+                updated = data is not None
+            if self.versioned and not updated:
+                await self.chk_version_conflict(record)
+            if self.is_session_model:
+                await session_cache.invalidate(
+                    self.db.engine.name, record.get("token")
+                )
+            if not acknowledged:
+                record.doc_version += 1
+                res = record
+            elif self.chk_reload(reload):
+                res = await self.load(record.rec_name_domain())
+            elif not data:
+                self.error_status(_("Not found"), record.rec_name_domain())
+                res = None
+            else:
+                self.load_data(self.decode_doc(data))
+                self.modelr.track_changes()
+                res = self.modelr
+            if res:
+                record.doc_version = res.doc_version
+            if dirty is not None:
+                record.track_changes()
+            return res
         except pymongo.errors.DuplicateKeyError as e:
             logger.error(f" Duplicate {e.details['errmsg']}")
             field = e.details["keyValue"]
@@ -690,7 +1285,40 @@ class OzonModelBase(OzonMBase):
             else:
                 return None
 
-    async def remove(self, record: CoreModel) -> bool:
+    def version_domain(self, record: CoreModel) -> dict:
+        """
+        :return: the record domain, for versioned models match only the
+                 doc_version of the stored document the record was read
+                 from, see CoreModel.get_stored_version
+        """
+        domain = record.rec_name_domain()
+        doc_version = record.get_stored_version()
+        if self.versioned and doc_version is not None:
+            if doc_version:
+                domain["doc_version"] = doc_version
+            else:
+                # stored before the model was versioned
+                domain["doc_version"] = {"$in": [0, None]}
+        return domain
+
+    async def chk_version_conflict(self, record: CoreModel):
+        """
+        raise VersionConflictException if the record exists, the update
+        did not match because of a newer doc_version
+        """
+        coll = self.db.engine.get_collection(self.data_model)
+        current = await coll.find_one(
+            record.rec_name_domain(), projection={"doc_version": 1}
+        )
+        if current:
+            raise VersionConflictException(
+                detail=_("Record %s changed by another writer")
+                % record.rec_name,
+                rec_name=record.rec_name,
+                version=current.get("doc_version", 0),
+            )
+
+    async def remove(self, record: CoreModel, write_profile=None) -> bool:
         self.init_status()
         if not self.chk_write_permission():
             msg = _("Session is Readonly")
@@ -701,11 +1329,15 @@ class OzonModelBase(OzonMBase):
                 _("Cannot delete a virtual object"), record.get_dict_copy()
             )
             return False
-        coll = self.db.engine.get_collection(self.data_model)
+        coll = self.get_collection(write_profile)
         await coll.delete_one(record.rec_name_domain())
+        if self.is_session_model:
+            await session_cache.invalidate(
+                self.db.engine.name, record.get("token")
+            )
         return True
 
-    async def remove_all(self, domain) -> int:
+    async def remove_all(self, domain, write_profile=None) -> int:
         self.init_status()
         if not self.chk_write_permission():
             msg = _("Session is Readonly")
@@ -717,15 +1349,25 @@ class OzonModelBase(OzonMBase):
             )
             self.error_status(msg, domain)
             return 0
-        coll = self.db.engine.get_collection(self.data_model)
+        coll = self.get_collection(write_profile)
         num = await coll.delete_many(domain)
+        if self.is_session_model:
+            await session_cache.invalidate_all(self.db.engine.name)
         return num
 
-    async def load(self, domain: dict) -> Union[None, CoreModel]:
+    async def load(
+        self, domain: dict, trusted: bool = None
+    ) -> Union[None, CoreModel]:
+        """
+        :param domain: the record domain
+        :param trusted: if True skip the validation of the record,
+                        default trusted_read, see make_record
+        """
         data = await self.load_raw(domain)
         if self.status.fail:
             return None
-        self.load_data(data)
+        self.load_data(data, self.chk_trusted(trusted))
+        self.modelr.track_changes()
         return self.modelr
 
     async def load_raw(self, domain: dict) -> Union[None, dict]:
@@ -736,40 +1378,72 @@ class OzonModelBase(OzonMBase):
             )
             self.error_status(msg, data=domain)
             return None
+        await self.flush_writes()
         coll = self.db.engine.get_collection(self.data_model)
         data = await coll.find_one(domain)
         if not data:
             self.error_status(_("Not found"), domain)
             return {}
+        return self.decode_doc(data)
+
+    def decode_doc(self, data: dict) -> dict:
+        """
+        :param data: the db document
+        :return: the document data without _id and with bson types
+                 converted as json values
+        """
         if data.get("_id"):
             data.pop("_id")
-        return json.loads(
-            json.dumps(data, cls=JsonEncoder, ensure_ascii=False)
-        )
+        return bson_to_python(data)
 
     async def find(
-        self, domain: dict, sort: str = "", limit=0, skip=0, pipeline_items=[]
+        self,
+        domain: dict,
+        sort: str = "",
+        limit=0,
+        skip=0,
+        pipeline_items=[],
+        trusted: bool = None,
+        fields: list[str] = None,
     ) -> list[CoreModel]:
+        """
+        :param trusted: if True skip the validation of the records,
+                        default trusted_read, see make_record
+        :param fields: load only these fields (and id, rec_name,
+                       doc_version), the records are partial, built as
+                       trusted, and the other fields raise FieldNotLoaded
+        """
+        trusted = self.chk_trusted(trusted)
+        projection = {}
+        if fields:
+            loaded = {f.split(".")[0] for f in fields}
+            loaded |= {"id", "rec_name", "doc_version"}
+            projection = {f: 1 for f in fields}
+            projection.update(rec_name=1, doc_version=1)
         datas = await self.find_raw(
             domain,
             sort=sort,
             limit=limit,
             skip=skip,
             pipeline_items=pipeline_items,
-            fields={},
+            fields=projection,
         )
         res = []
         if datas:
             for rec_dat in datas:
-                rec_data = json.loads(
-                    json.dumps(rec_dat, cls=JsonEncoder, ensure_ascii=False)
-                )
+                rec_data = bson_to_python(rec_dat)
                 if "_id" in rec_data:
                     rec_data['id'] = rec_data.pop("_id")
                 if self.virtual:
                     res.append(self.load_data(rec_data))
                 else:
-                    res.append(self.model(**rec_data))
+                    # partial documents miss the required fields
+                    partial = bool(fields)
+                    record = self.make_record(rec_data, trusted, partial)
+                    if partial:
+                        record.set_loaded_fields(loaded)
+                    record.track_changes()
+                    res.append(record)
         return res
 
     async def find_raw(
@@ -781,6 +1455,9 @@ class OzonModelBase(OzonMBase):
         pipeline_items=[],
         fields={},
     ) -> list[dict]:
+        """
+        :param fields: the projection, applied after pipeline_items
+        """
         self.init_status()
         if self.virtual and not self.data_model:
             msg = _(
@@ -788,25 +1465,17 @@ class OzonModelBase(OzonMBase):
             )
             self.error_status(msg, domain)
             return []
+        await self.flush_writes()
         _sort = self.eval_sort_str(sort)
         coll = self.db.engine.get_collection(self.data_model)
+        start_time = time.monotonic()
         if fields and not pipeline_items:
-            res = []
+            datas = coll.find(domain, projection=fields)
+            if _sort:
+                datas = datas.sort(_sort)
             if limit > 0:
-                datas = (
-                    coll.find(domain, projection=fields)
-                    .sort(sort)
-                    .skip(skip)
-                    .limit(limit)
-                )
-            elif sort:
-                datas = coll.find(domain, projection=fields).sort(sort)
-            else:
-                datas = coll.find(domain, projection=fields)
-            if datas:
-                return await datas.to_list(length=None)
+                datas = datas.skip(skip).limit(limit)
         else:
-            res = []
             pipeline = [{"$match": domain}]
             for item in pipeline_items:
                 pipeline.append(item)
@@ -815,10 +1484,161 @@ class OzonModelBase(OzonMBase):
             if limit > 0:
                 pipeline.append({"$skip": skip})
                 pipeline.append({"$limit": limit})
+            if fields:
+                pipeline.append({"$project": fields})
             datas = coll.aggregate(pipeline)
-            if datas:
-                return await datas.to_list(length=None)
+        res = await datas.to_list(length=None)
+        query_log.record(
+            self.name, "find_raw", domain, start_time, len(res), _sort
+        )
+        return res
 
+    async def find_iter(
+        self,
+        domain: dict,
+        sort: str = "",
+        limit=0,
+        skip=0,
+        batch_size=100,
+        raw=False,
+        trusted: bool = None,
+    ) -> AsyncIterator[Union[CoreModel, dict]]:
+        """
+        iterate the records of domain reading them from the db cursor
+        in batches, the records are not loaded in memory all at once.
+        :param batch_size: the records fetched by each cursor round trip
+        :param raw: if True yield the db documents instead of records
+        :param trusted: if True skip the validation of the records,
+                        default trusted_read, see make_record
+        """
+        trusted = self.chk_trusted(trusted)
+        self.init_status()
+        if self.virtual and not self.data_model:
+            msg = _(
+                "Data Model is required for virtual model to get data from db"
+            )
+            self.error_status(msg, domain)
+            return
+        await self.flush_writes()
+        coll = self.db.engine.get_collection(self.data_model)
+        cursor = coll.find(domain, batch_size=batch_size)
+        _sort = self.eval_sort_str(sort)
+        if _sort:
+            cursor = cursor.sort(_sort)
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit > 0:
+            cursor = cursor.limit(limit)
+        async for data in cursor:
+            if raw:
+                yield data
+            else:
+                yield self.doc_to_record(data, trusted)
+
+    def doc_to_record(self, data: dict, trusted=False) -> CoreModel:
+        """
+        :param data: the db document
+        :param trusted: see make_record
+        :return: the record tracking the changes
+        """
+        rec_data = bson_to_python(data)
+        if "_id" in rec_data:
+            rec_data['id'] = rec_data.pop("_id")
+        if self.virtual:
+            self.load_data(rec_data)
+            return self.modelr
+        record = self.make_record(rec_data, trusted)
+        record.track_changes()
+        return record
+
+    async def find_raw_page(
+        self,
+        domain: dict,
+        sort: str = "",
+        limit=50,
+        cursor: str = "",
+        fields={},
+    ) -> PageReturn:
+        """
+        keyset pagination: the page starts after the last record of the
+        previous page using a range predicate on the sort keys instead
+        of skip, _id is added to the sort keys to make the order unique.
+        :param sort: the sort rules, see eval_sort_str
+        :param limit: the page size
+        :param cursor: the PageReturn.cursor of the previous page,
+                       empty for the first page
+        :param fields: the projection
+        :return: PageReturn with the db documents and the next page cursor
+        """
+        self.init_status()
+        if self.virtual and not self.data_model:
+            msg = _(
+                "Data Model is required for virtual model to get data from db"
+            )
+            self.error_status(msg, domain)
+            return PageReturn(fail=True, msg=msg)
+        await self.flush_writes()
+        keys = list(self.eval_sort_str(sort).items())
+        if "_id" not in dict(keys):
+            keys.append(("_id", keys[-1][1] if keys else 1))
+        query = domain
+        if cursor:
+            try:
+                values = parse_page_token(cursor, keys)
+            except ValueError as e:
+                logger.error(f" page cursor {e}")
+                msg = _("Invalid page cursor")
+                self.error_status(msg, domain)
+                return PageReturn(fail=True, msg=msg)
+            query = {"$and": [domain, keyset_domain(keys, values)]}
+        if fields and all(fields.values()):
+            # the sort keys are needed for the next page cursor
+            fields = {**fields, **{key: 1 for key, _d in keys}}
+        coll = self.db.engine.get_collection(self.data_model)
+        start_time = time.monotonic()
+        datas = (
+            await coll.find(query, projection=fields or None)
+            .sort(keys)
+            .limit(limit + 1)
+            .to_list(length=None)
+        )
+        query_log.record(
+            self.name,
+            "find_raw_page",
+            query,
+            start_time,
+            len(datas),
+            dict(keys),
+        )
+        res = PageReturn()
+        if len(datas) > limit:
+            datas = datas[:limit]
+            res.cursor = make_page_token(
+                keys, [get_path_value(datas[-1], key) for key, _d in keys]
+            )
+        res.records = datas
+        return res
+
+    async def find_page(
+        self,
+        domain: dict,
+        sort: str = "",
+        limit=50,
+        cursor: str = "",
+        trusted: bool = None,
+    ) -> PageReturn:
+        """
+        keyset pagination of the records, see find_raw_page
+        :param trusted: if True skip the validation of the records,
+                        default trusted_read, see make_record
+        """
+        res = await self.find_raw_page(
+            domain, sort=sort, limit=limit, cursor=cursor
+        )
+        trusted = self.chk_trusted(trusted)
+        res.records = [
+            self.doc_to_record(data, trusted) for data in res.records
+        ]
         return res
 
     async def aggregate_raw(
@@ -830,8 +1650,13 @@ class OzonModelBase(OzonMBase):
         if limit > 0:
             pipeline.append({"$skip": skip})
             pipeline.append({"$limit": limit})
+        await self.flush_writes()
         coll = self.db.engine.get_collection(self.data_model)
+        start_time = time.monotonic()
         datas = await coll.aggregate(pipeline).to_list(length=None)
+        query_log.record(
+            self.name, "aggregate_raw", pipeline, start_time, len(datas)
+        )
         return datas
 
     async def aggregate(
@@ -842,9 +1667,7 @@ class OzonModelBase(OzonMBase):
         )
         res = []
         for rec_dat in datas:
-            rec_data = json.loads(
-                json.dumps(rec_dat, cls=JsonEncoder, ensure_ascii=False)
-            )
+            rec_data = bson_to_python(rec_dat)
             agg_mm = ModelMaker(f"{self.data_model}.agg")
             if "_id" in rec_data:
                 rec_data['id'] = rec_data.pop("_id")
@@ -853,6 +1676,29 @@ class OzonModelBase(OzonMBase):
             res.append(agg_mm.instance)
         return res
 
+    async def aggregate_iter(
+        self, pipeline: list, batch_size=100, raw=False
+    ) -> AsyncIterator[Union[BasicModel, dict]]:
+        """
+        iterate the pipeline results reading them from the db cursor
+        in batches, see aggregate
+        :param batch_size: the results fetched by each cursor round trip
+        :param raw: if True yield the db documents instead of records
+        """
+        await self.flush_writes()
+        coll = self.db.engine.get_collection(self.data_model)
+        async for data in coll.aggregate(pipeline, batchSize=batch_size):
+            if raw:
+                yield data
+                continue
+            rec_data = bson_to_python(data)
+            agg_mm = ModelMaker(f"{self.data_model}.agg")
+            if "_id" in rec_data:
+                rec_data['id'] = rec_data.pop("_id")
+            agg_mm.from_data_dict(rec_data)
+            agg_mm.new()
+            yield agg_mm.instance
+
     async def distinct(self, field_name: str, query: dict) -> list[Any]:
         self.init_status()
         if self.virtual and not self.data_model:
@@ -861,10 +1707,48 @@ class OzonModelBase(OzonMBase):
             )
             self.error_status(msg, query)
             return []
+        await self.flush_writes()
         coll = self.db.engine.get_collection(self.data_model)
+        start_time = time.monotonic()
         datas = await coll.distinct(field_name, query)
+        query_log.record(self.name, "distinct", query, start_time, len(datas))
         return datas
 
+    async def explain(self, domain: dict, sort: str = "") -> ExplainReturn:
+        """
+        the query plan chosen by the db for find_raw(domain, sort)
+        :return: ExplainReturn with the winning plan, its stages and
+                 the indexes used, index_used False is a collection scan
+        """
+        self.init_status()
+        if self.virtual and not self.data_model:
+            msg = _(
+                "Data Model is required for virtual model to get data from db"
+            )
+            self.error_status(msg, domain)
+            return ExplainReturn(fail=True, msg=msg)
+        query = {"find": self.data_model, "filter": domain}
+        _sort = self.eval_sort_str(sort)
+        if _sort:
+            query["sort"] = _sort
+        try:
+            res = await self.db.engine.command(
+                "explain", query, verbosity="queryPlanner"
+            )
+        except PyMongoError as e:
+            logger.error(f" explain {self.name} {e}")
+            msg = _("Error explain query: %s") % str(e)
+            self.error_status(msg, domain)
+            return ExplainReturn(fail=True, msg=msg)
+        plan = winning_plan(res)
+        stages, indexes = plan_summary(plan)
+        return ExplainReturn(
+            plan=plan,
+            stages=stages,
+            indexes=indexes,
+            index_used=bool(index_stages.intersection(stages)),
+        )
+
     async def search_all_distinct(
         self,
         distinct="",
@@ -931,7 +1815,9 @@ class OzonModelBase(OzonMBase):
                 pipeline, sort=sort, limit=limit, skip=skip
             )
 
-    async def set_to_delete(self, record: CoreModel) -> Union[None, CoreModel]:
+    async def set_to_delete(
+        self, record: CoreModel, reload: bool = None
+    ) -> Union[None, CoreModel]:
         self.init_status()
         if not self.chk_write_permission():
             msg = _("Session is Readonly")
@@ -945,9 +1831,11 @@ class OzonModelBase(OzonMBase):
             days=self.setting_app.delete_record_after_days
         )
         record.set_to_delete(delete_at_datetime.timestamp())
-        return await self.update(record)
+        return await self.update(record, reload=reload)
 
-    async def set_active(self, record: CoreModel) -> Union[None, CoreModel]:
+    async def set_active(
+        self, record: CoreModel, reload: bool = None
+    ) -> Union[None, CoreModel]:
         self.init_status()
         if not self.chk_write_permission():
             msg = _("Session is Readonly")
@@ -958,4 +1846,69 @@ class OzonModelBase(OzonMBase):
             self.error_status(msg, record.get_dict_copy())
             return None
         record.set_active()
-        return await self.update(record)
+        return await self.update(record, reload=reload)
+
+    async def update_many_status(
+        self, domain: dict, values: dict, write_profile=None
+    ) -> BulkReturn:
+        """
+        set the status fields (active, deleted) of the records in domain
+        with a single update_many
+        :return: BulkReturn with matched and modified count
+        """
+        self.init_status()
+        if not self.chk_write_permission():
+            msg = _("Session is Readonly")
+            self.error_status(msg, data=domain)
+            return BulkReturn(fail=True, msg=msg)
+        if self.virtual:
+            msg = _("Unable to set to delete a virtual model")
+            self.error_status(msg, domain)
+            return BulkReturn(fail=True, msg=msg)
+        values = values.copy()
+        values["update_uid"] = self.orm.user_session.get("user.uid")
+        values["update_datetime"] = datetime.now().isoformat()
+        # the buffered updates are written before, they could be
+        # overwritten with the old status
+        await self.flush_writes()
+        coll = self.get_collection(write_profile)
+        result = await coll.update_many(
+            domain, {"$set": values, "$inc": {"doc_version": 1}}
+        )
+        if self.is_session_model:
+            await session_cache.invalidate_all(self.db.engine.name)
+        if not result.acknowledged:
+            return BulkReturn()
+        return BulkReturn(
+            matched=result.matched_count, modified=result.modified_count
+        )
+
+    async def set_to_delete_many(
+        self, domain: dict, write_profile=None
+    ) -> BulkReturn:
+        """
+        set to delete the records in domain, they are deleted after
+        Settings.delete_record_after_days, see set_to_delete
+        """
+        delete_at_datetime = datetime.now() + timedelta(
+            days=self.setting_app.delete_record_after_days
+        )
+        return await self.update_many_status(
+            domain,
+            {"deleted": delete_at_datetime.timestamp(), "active": False},
+            write_profile=write_profile,
+        )
+
+    async def archive_many(
+        self, domain: dict, write_profile=None
+    ) -> BulkReturn:
+        return await self.update_many_status(
+            domain, {"deleted": 0, "active": False}, write_profile
+        )
+
+    async def restore_many(
+        self, domain: dict, write_profile=None
+    ) -> BulkReturn:
+        return await self.update_many_status(
+            domain, {"deleted": 0, "active": True}, write_profile
+        )
@@ -6,13 +6,17 @@ import logging
 
 # from ozonenv.core.cache.cache import get_cache
 import os
+import re
 import sys
 import time as time_
+import types
+import warnings
 from os.path import dirname, exists
+from typing import Union
 
 import aiofiles
-from aiopath import AsyncPath
-from starlette.concurrency import run_in_threadpool
+import aiofiles.os
+from pymongo.errors import OperationFailure, PyMongoError
 
 from ozonenv.core.BaseModels import (
     DbViewModel,
@@ -24,9 +28,14 @@ from ozonenv.core.BaseModels import (
     Dict,
     BasicModel,
 )
+from ozonenv.core.BootstrapProfiler import BootstrapProfiler, null_profiler
+from ozonenv.core.ModelRegistry import model_registry
 from ozonenv.core.OzonClient import OzonClient
 from ozonenv.core.OzonModel import OzonModelBase, BasicReturn
+from ozonenv.core.UnitOfWork import UnitOfWork
+from ozonenv.core.WriteBuffer import WriteBuffer
 from ozonenv.core.cache.cache_utils import stop_cache  # , init_cache
+from ozonenv.core.cache.session_cache import session_cache
 from ozonenv.core.db.mongodb_utils import (
     connect_to_mongo,
     close_mongo_connection,
@@ -38,6 +47,7 @@ from ozonenv.core.db.mongodb_utils import (
 from ozonenv.core.exceptions import SessionException
 from ozonenv.core.i18n import _
 from ozonenv.core.i18n import update_translation
+from ozonenv.core.utils import run_in_threadpool, parse_datetime
 
 logger = logging.getLogger(__file__)
 
@@ -45,6 +55,31 @@ MAIN_CACHE_TIME = 800
 
 base_model_path = dirname(__file__)
 
+model_version_regex = re.compile(r"def get_version\(cls\):\s+return '([^']*)'")
+
+
+class OzonModels(dict):
+    """
+    Models of the env by name, if the env use lazy models a model
+    is built on first access and memoized.
+    """
+
+    def __init__(self, env):
+        super().__init__()
+        self.env = env
+
+    def __missing__(self, model_name):
+        orm = getattr(self.env, "orm", None)
+        if orm and model_name in orm.lazy_models:
+            return orm.load_lazy_model(model_name)
+        raise KeyError(model_name)
+
+    def get(self, model_name, default=None):
+        try:
+            return self[model_name]
+        except KeyError:
+            return default
+
 
 class OzonEnvBase:
     def __init__(
@@ -72,7 +107,10 @@ class OzonEnvBase:
             self.config_system = cfg.copy()
         self.db_settings = DbSettings(**self.config_system)
         self.model = ""
-        self.models: Dict[str, cls_model] = {}
+        self.models: Dict[str, cls_model] = OzonModels(self)
+        # the write buffers of the models by data_model, see
+        # OzonModelBase.enable_write_buffer
+        self.write_buffers: Dict[str, WriteBuffer] = {}
         self.params = {}
         self.session_is_api = False
         self.user_session: CoreModel
@@ -88,6 +126,24 @@ class OzonEnvBase:
         self.is_db_local = True
         self.app_code = self.config_system.get("app_code")
         self.cls_model = cls_model
+        # persistent env are kept initialized between sessions,
+        # see OzonEnvPool
+        self.persistent = False
+        self.env_ready = False
+        # build db models on first access, see OzonOrm.init_lazy_models
+        self.lazy_models: bool = bool(
+            self.config_system.get("lazy_models", False)
+        )
+        self.watcher_task: asyncio.Task = None
+        # record the bootstrap phases duration in bootstrap_report
+        self.profile_bootstrap: bool = bool(
+            self.config_system.get("bootstrap_profile", False)
+        )
+        self.profiler = null_profiler
+        self.bootstrap_report: dict = {}
+        # the env is initialized but the first session is not started yet,
+        # the session phases are added to the init_env report
+        self.bootstrap_pending = False
 
     @classmethod
     async def readfilejson(cls, cfg_file):
@@ -113,6 +169,12 @@ class OzonEnvBase:
     def success_response(cls, msg, data={}):
         return BasicReturn(fail=False, msg=msg, data=data)
 
+    def start_profiler(self):
+        if self.profile_bootstrap:
+            self.profiler = BootstrapProfiler(self.get_formatted_metrics)
+        else:
+            self.profiler = null_profiler
+
     @classmethod
     def get_value_for_select_list(cls, list_src, key, label_key="label"):
         for item in list_src:
@@ -122,7 +184,7 @@ class OzonEnvBase:
 
     async def set_lang(self, lang="it", update=False):
         self.lang = lang
-        await run_in_threadpool(update_translation, lang)
+        update_translation(lang)
         # locale.setlocale(locale.LC_NUMERIC, locale.locale_alias[lang])
         if update:
             await self.orm.set_lang()
@@ -148,8 +210,30 @@ class OzonEnvBase:
         return self.models.get(model_name)
 
     def get_collection(self, collection) -> Collection[_DocumentType]:
+        """
+        the raw collection does not write the buffered updates of the
+        models before reading, call flush_writes first
+        """
         return self.db.engine.get_collection(collection)
 
+    def unit_of_work(
+        self, transaction=False, ordered=True, write_profile=None
+    ) -> UnitOfWork:
+        """
+        :param transaction: write all the collections in a single db
+                            transaction, require a replica set
+        :param ordered: stop the collection writes at the first error
+        :param write_profile: the write concern profile of the flush,
+                              default the models write_profile
+        :return: UnitOfWork, use as async context manager
+        """
+        return UnitOfWork(
+            self,
+            transaction=transaction,
+            ordered=ordered,
+            write_profile=write_profile,
+        )
+
     async def add_schema(self, schema: dict) -> OzonModelBase:
         component_model = self.models.get("component")
         component = await component_model.new(schema)
@@ -165,7 +249,7 @@ class OzonEnvBase:
     ) -> OzonModelBase:
         if self.user_session.is_public:
             return None
-        if model_name not in self.models:
+        if not self.get(model_name):
             await self.orm.add_model(
                 model_name, virtual=virtual, data_model=data_model
             )
@@ -198,8 +282,10 @@ class OzonEnvBase:
             self.db = db
             self.is_db_local = False
         else:
-            await self.connect_db()
-        await self.set_lang()
+            with self.profiler.phase("connect_db"):
+                await self.connect_db()
+        with self.profiler.phase("set_lang"):
+            await self.set_lang()
         self.orm = OzonOrm(self, cls_model=self.cls_model)
         if local_model:
             for k, v in local_model.items():
@@ -218,14 +304,64 @@ class OzonEnvBase:
             local_model = {}
         if local_model_private is None:
             local_model_private = []
+        self.start_profiler()
         await self.init_orm(
             db=db,
             local_model=local_model,
             local_model_private=local_model_private,
         )
         await self.orm.init_models()
+        self.env_ready = True
+        self.bootstrap_pending = True
+        self.bootstrap_report = self.profiler.report()
+
+    def start_watcher(self):
+        """
+        keep models and settings up to date watching the db changes,
+        require a replica set.
+        """
+        if not self.watcher_task:
+            self.watcher_task = asyncio.create_task(self.orm.watch_changes())
+
+    async def stop_watcher(self):
+        if self.watcher_task:
+            self.watcher_task.cancel()
+            try:
+                await self.watcher_task
+            except asyncio.CancelledError:
+                pass
+            self.watcher_task = None
+
+    async def flush_writes(self):
+        """
+        write the buffered updates of the models, see
+        OzonModelBase.enable_write_buffer
+        """
+        for buffer in list(self.write_buffers.values()):
+            await buffer.flush()
+
+    def reset_session(self):
+        """
+        reset only the per-session state, the db connection, the orm and
+        the models are kept warm for the next session.
+        """
+        self.model = ""
+        self.session_is_api = False
+        self.session_token = None
+        self.user_session = None
+        self.orm.user_session = None
+        for model in self.models.values():
+            model.reset_options()
+        self.write_buffers = {
+            model.data_model: model.write_buffer
+            for model in self.models.values()
+            if model.write_buffer is not None
+        }
 
     async def close_env(self):
+        self.env_ready = False
+        await self.stop_watcher()
+        await self.flush_writes()
         if self.is_db_local:
             await self.close_db()
         if self.use_cache:
@@ -245,9 +381,19 @@ class OzonEnvBase:
             self.use_cache = use_cache
             self.cache_index = cache_idx
             self.redis_url = redis_url
-            await self.init_env(db=db, local_model=local_model)
+            if self.env_ready:
+                if not self.bootstrap_pending:
+                    self.start_profiler()
+                # the updates buffered by the previous session
+                await self.flush_writes()
+                self.reset_session()
+            else:
+                await self.init_env(db=db, local_model=local_model)
             res = await self.session_app()
-            await self.close_env()
+            if self.profiler.enabled and not res.fail:
+                res.data["bootstrap_profile"] = self.bootstrap_report
+            if not self.persistent:
+                await self.close_env()
             return res
         except Exception as e:
             logger.exception(e)
@@ -256,7 +402,10 @@ class OzonEnvBase:
     async def session_app(self) -> BasicReturn:
         self.session_is_api = self.params.get("session_is_api", False)
         self.session_token = self.params.get("current_session_token")
-        await self.orm.init_session(self.session_token)
+        with self.profiler.phase("init_session"):
+            await self.orm.init_session(self.session_token)
+        self.bootstrap_pending = False
+        self.bootstrap_report = self.profiler.report()
         if not self.upload_folder:
             self.upload_folder = self.orm.app_settings.upload_folder
         self.user_session = self.orm.user_session
@@ -288,12 +437,25 @@ class OzonOrm:
             "settings": Settings,
         }
         self.db_models = []
+        # lazy model name -> component version
+        self.lazy_models: Dict[str, str] = {}
         self.orm_sys_models = ["component", "session", "settings"]
         self.private_models = ["settings"]
         self.models_path = self.env.models_folder
         self.app_settings: Settings = None
         self.app_code = self.env.app_code
         self.cls_model = cls_model
+        # max number of db models built at the same time in init_models
+        self.bootstrap_concurrency: int = self.config_system.get(
+            "bootstrap_concurrency", 8
+        )
+        # max seconds a session is kept in cache, 0 (default) disable the
+        # cache; a session changed or removed by another process or
+        # directly on the db is seen only after the ttl, so a revoked
+        # token can authenticate for up to session_cache_ttl seconds
+        self.session_cache_ttl: int = self.config_system.get(
+            "session_cache_ttl", 0
+        )
 
     def add_private_model(self, name):
         if name not in self.private_models:
@@ -317,49 +479,161 @@ class OzonOrm:
         return self.env.models[_model_name]
 
     async def init_db_models(self):
-        self.db_models = await self.get_collections_names()
-        self.app_settings = await self.init_settings(self.app_code)
+        profiler = self.env.profiler
+        with profiler.phase("collections_names"):
+            self.db_models = await self.get_collections_names()
+        with profiler.phase("init_settings"):
+            self.app_settings = await self.init_settings(self.app_code)
 
     async def init_models(self):
         # self.models_path = self.config_system.get("models_folder", "/models")
         await self.init_db_models()
-        await AsyncPath(self.models_path).mkdir(parents=True, exist_ok=True)
-        await AsyncPath(f"{self.models_path}/__init__.py").touch(exist_ok=True)
-        self.list_auto_models = AsyncPath(self.models_path).glob("*.py")
-        for main_model in self.orm_models:
-            if main_model not in self.env.models:
-                await self.make_model(main_model)
-
-        for db_model in self.db_models:
-            if db_model not in list(self.env.models.keys()):
-                home = AsyncPath(f"{self.models_path}/{db_model}.py")
-                if await home.exists():
-                    await self.import_module_model(db_model)
-                    model = self.orm_static_models_map[db_model]
-                    component = await self.env.get("component").load(
-                        {
-                            '$and': [
-                                {"rec_name": db_model},
-                                {
-                                    'update_datetime': {
-                                        '$gt': model.get_version()
-                                    }
-                                },
-                            ]
-                        }
+        await aiofiles.os.makedirs(self.models_path, exist_ok=True)
+        async with aiofiles.open(f"{self.models_path}/__init__.py", "a"):
+            pass
+        profiler = self.env.profiler
+        with profiler.phase("orm_models"):
+            for main_model in self.orm_models:
+                if main_model not in self.env.models:
+                    with profiler.model(main_model):
+                        await self.make_model(main_model)
+
+        with profiler.phase("db_models"):
+            if self.env.lazy_models and self.lazy_supported():
+                await self.init_lazy_models()
+                return
+            names = [n for n in self.db_models if n not in self.env.models]
+            components_version = await self.get_components_version(names)
+            await self.init_db_models_concurrently(names, components_version)
+
+    async def init_db_models_concurrently(
+        self, names: list, components_version: Dict[str, str]
+    ):
+        semaphore = asyncio.Semaphore(self.bootstrap_concurrency)
+
+        async def init_db_model(db_model):
+            async with semaphore:
+                with self.env.profiler.model(db_model):
+                    await self.init_db_model(
+                        db_model,
+                        version=components_version.get(db_model, ""),
                     )
-                    if component:
-                        await self.update_model(
-                            component.get_dict_copy(), component
-                        )
-                    else:
-                        await self.make_model(db_model)
-                else:
-                    await self.add_model(db_model)
+
+        await asyncio.gather(*[init_db_model(name) for name in names])
+
+    async def init_db_model(self, db_model, version=""):
+        """
+        :param db_model: the model name
+        :param version: the component version (update_datetime isoformat),
+                        if newer than the built model the model is rebuilt
+        """
+        item = model_registry.get(self.models_path, db_model)
+        if item:
+            self.orm_static_models_map[db_model] = item.model
+        elif await aiofiles.os.path.exists(
+            f"{self.models_path}/{db_model}.py"
+        ):
+            await run_in_threadpool(self.load_module_model, db_model)
+        else:
+            await self.add_model(db_model, update_db_models=False)
+            return
+        model = self.orm_static_models_map[db_model]
+        if version and version > model.get_version():
+            component = await self.load_component(db_model)
+            if not component:
+                # the component was removed after reading its version
+                logger.warning(f"component {db_model} not found, skipped")
+                return
+            await self.update_model(component.get_dict_copy(), component)
+        else:
+            await self.make_model(db_model)
+
+    async def load_component(self, model_name) -> Union[None, Component]:
+        """
+        read the component of the model without using the status and the
+        record of the component model, the models are built concurrently
+        :return: the Component or None if not found
+        """
+        coll = self.db.engine.get_collection("component")
+        data = await coll.find_one({"rec_name": model_name})
+        if not data:
+            return None
+        component_model = self.env.get("component")
+        return component_model.make_record(component_model.decode_doc(data))
+
+    async def get_components_version(self, names: list) -> Dict[str, str]:
+        coll = self.db.engine.get_collection("component")
+        datas = coll.find(
+            {"rec_name": {"$in": names}},
+            projection={"rec_name": 1, "update_datetime": 1},
+        )
+        res = {}
+        for rec in await datas.to_list(length=None):
+            version = rec.get("update_datetime") or ""
+            if isinstance(version, str) and version:
+                version = parse_datetime(version)
+            if version:
+                res[rec["rec_name"]] = version.isoformat()
+        return res
+
+    async def get_module_version(self, model_name) -> Union[None, str]:
+        file_path = f"{self.models_path}/{model_name}.py"
+        if not await aiofiles.os.path.exists(file_path):
+            return None
+        async with aiofiles.open(file_path, "r", encoding="utf-8") as f:
+            code = await f.read()
+        res = model_version_regex.search(code)
+        return res.group(1) if res else ""
+
+    async def init_lazy_models(self):
+        """
+        record the db models that can be attached on first access from the
+        registry or from an up-to-date generated module, the models whose
+        component is newer are rebuilt now.
+        """
+        names = [n for n in self.db_models if n not in self.env.models]
+        components_version = await self.get_components_version(names)
+        to_init = []
+        for db_model in names:
+            version = components_version.get(db_model, "")
+            item = model_registry.get(self.models_path, db_model)
+            if item:
+                current = item.version
+            else:
+                current = await self.get_module_version(db_model)
+            if current is None and not version:
+                # no component and no model to build
+                continue
+            if current is not None and current >= version:
+                self.lazy_models[db_model] = version
+            else:
+                to_init.append(db_model)
+        await self.init_db_models_concurrently(to_init, components_version)
+
+    def lazy_supported(self) -> bool:
+        """
+        a lazy model is built on the sync first access, where the async
+        init_model hook can not be awaited: if cls_model overrides it the
+        db models are built at init as in the eager mode.
+        """
+        return self.cls_model.init_model is OzonModelBase.init_model
+
+    def load_lazy_model(self, model_name) -> OzonModelBase:
+        self.lazy_models.pop(model_name, None)
+        item = model_registry.get(self.models_path, model_name)
+        if item:
+            self.orm_static_models_map[model_name] = item.model
+        else:
+            self.load_module_model(model_name)
+        model = self.new_model(model_name)
+        # the default init_model, see lazy_supported
+        model.setup_model()
+        self.env.models[model_name] = model
+        return model
 
     async def get_collections_names(self, query={}):
         if not query:
-            query = {"name": {"$regex": r"^(?!system\.)"}}
+            query = {"name": {"$regex": r"^(?!system\.|_ozon_)"}}
         collection_names = await self.db.engine.list_collection_names(
             filter=query
         )
@@ -411,11 +685,29 @@ class OzonOrm:
             return False
 
     async def init_session(self, token):
+        namespace = self.db.engine.name
+        if self.session_cache_ttl and token:
+            self.user_session = await session_cache.get(namespace, token)
+            if self.user_session:
+                return
         self.user_session = await self.env.get("session").load(
             {"token": token}
         )
+        if self.user_session and self.session_cache_ttl:
+            expire_hours = 0
+            if self.app_settings:
+                expire_hours = self.app_settings.session_expire_hours
+            ttl = session_cache.get_ttl(
+                self.user_session, self.session_cache_ttl, expire_hours
+            )
+            await session_cache.set(namespace, token, self.user_session, ttl)
 
     async def runcmd(self, cmd):
+        warnings.warn(
+            "runcmd is deprecated, the model code is generated in-process",
+            DeprecationWarning,
+            stacklevel=2,
+        )
         # for security reason check the command
         if not cmd.startswith("datamodel-codegen --input"):
             return
@@ -431,6 +723,15 @@ class OzonOrm:
         return res
 
     async def import_module_model(self, model_name):
+        self.load_module_model(model_name)
+
+    def load_module_model(self, model_name, code: str = "", mm=None):
+        """
+        :param model_name: the model name
+        :param mm: the ModelMaker used to generate the module code
+        :param code: if set exec this source instead of the module file
+        """
+
         def camel(snake_str):
             names = snake_str.split("_")
             return "".join([*map(str.title, names)])
@@ -444,29 +745,73 @@ class OzonOrm:
         mclass = camel(model_name)
         module_name = f"{model_name}"
         file_path = f"{self.models_path}/{model_name}.py"
-        spec = importlib.util.spec_from_file_location(module_name, file_path)
-        module = importlib.util.module_from_spec(spec)
-        sys.modules[module_name] = module
-        spec.loader.exec_module(module)
+        if code:
+            module = types.ModuleType(module_name)
+            module.__file__ = file_path
+            sys.modules[module_name] = module
+            exec(compile(code, file_path, "exec"), module.__dict__)
+        else:
+            spec = importlib.util.spec_from_file_location(
+                module_name, file_path
+            )
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
         model, parent = _getattribute(module, mclass)
         self.orm_static_models_map[model_name] = model
+        model_registry.register(
+            self.models_path, model_name, model.get_version(), model, mm=mm
+        )
+
+    async def make_local_model(self, mod, version) -> str:
+        """
+        generate the model module code of mod and write it in the models
+        folder, the file is rewritten only if the code is changed.
+        :return: the module code
+        """
+        with self.env.profiler.model_code(mod.name):
+            code = await run_in_threadpool(self.make_model_code, mod, version)
+        file_path = f"{self.models_path}/{mod.name}.py"
+        if await aiofiles.os.path.exists(file_path):
+            async with aiofiles.open(file_path, "r", encoding="utf-8") as f:
+                if await f.read() == code:
+                    return code
+        async with aiofiles.open(file_path, "w", encoding="utf-8") as f:
+            await f.write(code)
+        return code
+
+    def make_model_code(self, mod, version) -> str:
+        from datamodel_code_generator import DataModelType, PythonVersion
+        from datamodel_code_generator.model import get_data_model_types
+        from datamodel_code_generator.parser.jsonschema import (
+            JsonSchemaParser,
+        )
 
-    async def make_local_model(self, mod, version):
         jdata = mod.mm.model.model_json_schema()
-        async with aiofiles.open(
-            f"/tmp/{mod.name}.json", "w+", encoding="utf-8"
-        ) as mod_file:
-            await mod_file.write(json.dumps(jdata, ensure_ascii=False))
-        res = await self.runcmd(
-            f"datamodel-codegen --input /tmp/{mod.name}.json"
-            f" --input-file-type jsonschema "
-            f" --output {self.models_path}/{mod.name}.py "
-            f" --output-model-type pydantic_v2.BaseModel "
-            f" --use-standard-collections "
-            f"--base-class ozonenv.core.BaseModels.BasicModel"
+        model_types = get_data_model_types(
+            DataModelType.PydanticV2BaseModel,
+            target_python_version=PythonVersion.PY_310,
+        )
+        parser = JsonSchemaParser(
+            json.dumps(jdata, ensure_ascii=False),
+            data_model_type=model_types.data_model,
+            data_model_root_type=model_types.root_model,
+            data_model_field_type=model_types.field_model,
+            data_type_manager_type=model_types.data_type_manager,
+            dump_resolve_reference_action=(
+                model_types.dump_resolve_reference_action
+            ),
+            target_python_version=PythonVersion.PY_310,
+            use_standard_collections=True,
+            base_class="ozonenv.core.BaseModels.BasicModel",
+        )
+        # not formatted, black and isort would read the settings of the
+        # working directory and the output would depend on their versions
+        body = parser.parse(format_=False)
+        header = (
+            "# generated by datamodel-codegen:\n"
+            f"#   filename:  {mod.name}.json\n"
         )
-        if not res:
-            return
         tmp = f"""
     
     @classmethod
@@ -553,10 +898,7 @@ class OzonOrm:
     def logic(cls) -> {{str, list}}:
         return {mod.mm.conditional}
 """
-        async with aiofiles.open(
-            f"{self.models_path}/{mod.name}.py", "a+", encoding="utf-8"
-        ) as mod_file:
-            await mod_file.write(tmp)
+        return f"{header}\n{body.rstrip()}\n{tmp}"
 
     async def init_model_and_write_code(
         self, model_name, data_model, virtual, schema, component
@@ -571,16 +913,21 @@ class OzonOrm:
             schema=schema,
             session_model=session_model,
         )
-        await mod.init_model()
-        await self.make_local_model(mod, component.update_datetime.isoformat())
+        await run_in_threadpool(mod.setup_model)
+        code = await self.make_local_model(
+            mod, component.update_datetime.isoformat()
+        )
+        await run_in_threadpool(
+            self.load_module_model, model_name, code, mod.mm
+        )
 
-    async def add_model(self, model_name, virtual=False, data_model=""):
+    async def add_model(
+        self, model_name, virtual=False, data_model="", update_db_models=True
+    ):
         schema = {}
         component = None
         if not virtual:
-            component = await self.env.get("component").load(
-                {"rec_name": model_name}
-            )
+            component = await self.load_component(model_name)
             if component:
                 schema = component.get_dict_copy()
         if (
@@ -589,15 +936,24 @@ class OzonOrm:
             and not virtual
             and component
         ):
-            if not exists(f"{self.models_path}/{model_name}.py"):
+            item = model_registry.get(
+                self.models_path,
+                model_name,
+                version=component.update_datetime.isoformat(),
+            )
+            if item:
+                self.orm_static_models_map[model_name] = item.model
+            elif not exists(f"{self.models_path}/{model_name}.py"):
                 await self.init_model_and_write_code(
                     model_name, data_model, virtual, schema, component
                 )
-            await self.import_module_model(model_name)
+            else:
+                await self.import_module_model(model_name)
         await self.make_model(
             model_name, schema=schema, virtual=virtual, data_model=data_model
         )
-        self.db_models = await self.get_collections_names()
+        if update_db_models:
+            self.db_models = await self.get_collections_names()
 
     async def make_model(
         self, model_name, schema: dict = None, virtual=False, data_model=""
@@ -605,42 +961,54 @@ class OzonOrm:
         if schema is None:
             schema = {}
         if model_name in list(self.orm_static_models_map.keys()) or virtual:
-            session_model = model_name == "session"
-            if not data_model and schema:
-                data_model = schema.get("data_model", "")
-            if (
-                not data_model
-                and not virtual
-                and self.orm_static_models_map[model_name].get_data_model()
-            ):
-                data_model = self.orm_static_models_map[
-                    model_name
-                ].get_data_model()
-            if data_model and virtual:
-                data_model_o = self.env.models.get(data_model)
-                if data_model_o and data_model_o.data_model:
-                    data_model = data_model_o.data_model
-            self.env.models[model_name] = self.cls_model(
+            self.lazy_models.pop(model_name, None)
+            self.env.models[model_name] = self.new_model(
                 model_name,
-                self,
-                data_model=data_model,
-                static=self.orm_static_models_map.get(model_name, None),
-                virtual=virtual,
                 schema=schema,
-                session_model=session_model,
+                virtual=virtual,
+                data_model=data_model,
             )
             await self.env.models[model_name].init_model()
             if not virtual:
                 if model_name not in self.db_models:
                     await self.env.models[model_name].init_unique()
 
+    def new_model(
+        self, model_name, schema: dict = None, virtual=False, data_model=""
+    ) -> OzonModelBase:
+        if schema is None:
+            schema = {}
+        session_model = model_name == "session"
+        if not data_model and schema:
+            data_model = schema.get("data_model", "")
+        if (
+            not data_model
+            and not virtual
+            and self.orm_static_models_map[model_name].get_data_model()
+        ):
+            data_model = self.orm_static_models_map[
+                model_name
+            ].get_data_model()
+        if data_model and virtual:
+            data_model_o = self.env.models.get(data_model)
+            if data_model_o and data_model_o.data_model:
+                data_model = data_model_o.data_model
+        return self.cls_model(
+            model_name,
+            self,
+            data_model=data_model,
+            static=self.orm_static_models_map.get(model_name, None),
+            virtual=virtual,
+            schema=schema,
+            session_model=session_model,
+        )
+
     async def update_model(self, schema, component):
         if schema.get("rec_name") in self.orm_static_models_map:
             self.orm_static_models_map.pop(schema.get("rec_name"))
         await self.init_model_and_write_code(
             schema.get("rec_name"), "", False, schema, component
         )
-        await self.import_module_model(schema.get("rec_name"))
         await self.make_model(
             schema.get("rec_name"),
             schema=schema,
@@ -653,6 +1021,87 @@ class OzonOrm:
         for model_name, model in self.env.models.items():
             await model.set_lang()
 
+    async def watch_changes(self, on_change=None):
+        """
+        watch with a change stream (replica set required) the component
+        and settings collections, rebuild the changed models and update
+        app_settings in place.
+        :param on_change: the coroutine called for each change, default
+                          self.on_change; OzonEnvPool notifies all its env
+                          from a single stream
+        """
+        if on_change is None:
+            on_change = self.on_change
+        pipeline = [
+            {
+                "$match": {
+                    "ns.coll": {"$in": ["component", "settings"]},
+                    "operationType": {"$in": ["insert", "update", "replace"]},
+                }
+            }
+        ]
+        resume_token = None
+        while True:
+            try:
+                async with self.db.engine.watch(
+                    pipeline,
+                    full_document="updateLookup",
+                    resume_after=resume_token,
+                ) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        try:
+                            await on_change(change)
+                        except Exception as e:
+                            logger.exception(e)
+            except OperationFailure as e:
+                logger.error(f" Error watch changes {e}")
+                return
+            except PyMongoError as e:
+                logger.warning(f" Watch changes interrupted {e}, resume")
+                await asyncio.sleep(1)
+
+    async def on_change(self, change: dict):
+        doc = change.get("fullDocument")
+        if not doc:
+            return
+        collection = change["ns"]["coll"]
+        if collection == "settings" and doc.get("rec_name") == self.app_code:
+            self.update_settings(doc)
+        elif collection == "component":
+            await self.reload_model(doc.get("rec_name"))
+
+    def update_settings(self, data: dict):
+        data = {k: v for k, v in data.items() if not k == "_id"}
+        settings = Settings(**data)
+        if not self.app_settings:
+            self.app_settings = settings
+            return
+        for field_name in Settings.model_fields:
+            setattr(
+                self.app_settings, field_name, getattr(settings, field_name)
+            )
+
+    async def reload_model(self, model_name):
+        if model_name in self.lazy_models:
+            self.lazy_models.pop(model_name)
+        elif model_name not in self.env.models:
+            return
+        component = await self.load_component(model_name)
+        if not component:
+            return
+        item = model_registry.get(
+            self.models_path,
+            model_name,
+            version=component.update_datetime.isoformat(),
+        )
+        if item:
+            self.orm_static_models_map[model_name] = item.model
+            await self.make_model(model_name)
+        else:
+            await self.update_model(component.get_dict_copy(), component)
+        logger.info(f"reload model {model_name}")
+
 
 class OzonModel(OzonModelBase):
     def __init__(
@@ -0,0 +1,360 @@
+import copy
+import logging
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+import pydantic
+from pymongo import DeleteOne, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from ozonenv.core.BaseModels import BulkError, BulkReturn, CoreModel
+from ozonenv.core.cache.session_cache import session_cache
+from ozonenv.core.db.mongodb_utils import write_profiles
+from ozonenv.core.exceptions import VersionConflictException
+from ozonenv.core.i18n import _
+
+if TYPE_CHECKING:
+    from ozonenv.core.OzonModel import OzonModelBase
+
+logger = logging.getLogger(__name__)
+
+
+class UnitOfWork:
+    """
+    Collect inserts, updates and deletes of several models and write them
+    with one bulk_write per collection, see OzonEnvBase.unit_of_work.
+
+        async with env.unit_of_work() as uow:
+            uow.insert(doc_model, doc)
+            for row in rows:
+                uow.insert(row_model, row)
+
+    The queue is flushed on exit only if the block did not raise.
+    With transaction=True the writes run in a single db transaction
+    (require a replica set), a failed write aborts all the collections.
+    Without transaction the flush is not atomic: the collections are
+    written one after the other and the writes done before a failure
+    (eg. a VersionConflictException) are kept.
+    The per collection outcome is stored in results (data_model: BulkReturn),
+    error indexes are the positions in the unit of work queue.
+    write_profile overrides the write concern of the models, see
+    OzonModelBase.get_collection; in a transaction it is the transaction
+    write concern.
+    """
+
+    def __init__(
+        self, env, transaction=False, ordered=True, write_profile=None
+    ):
+        self.env = env
+        self.transaction = transaction
+        self.ordered = ordered
+        self.write_profile = write_profile
+        self.queue: list[tuple[str, "OzonModelBase", CoreModel, bool]] = []
+        self.results: dict[str, BulkReturn] = {}
+        # the queue items written by the flush
+        self.written: list = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.flush()
+        else:
+            self.clear()
+        return False
+
+    @property
+    def fail(self) -> bool:
+        return any(res.fail for res in self.results.values())
+
+    def clear(self):
+        self.queue = []
+
+    def abort(self):
+        """
+        the transaction is aborted, nothing is written
+        """
+        self.written = []
+        for res in self.results.values():
+            res.inserted = res.matched = res.modified = res.deleted = 0
+            res.fail = True
+            res.msg = _("Transaction aborted")
+
+    def chk_model(self, model: "OzonModelBase", record: CoreModel) -> bool:
+        model.init_status()
+        if not model.chk_write_permission():
+            model.error_status(_("Session is Readonly"), data={})
+            return False
+        if model.virtual and not model.data_model:
+            model.error_status(
+                _("Cannot save on db a virtual object"),
+                record.get_dict_copy(),
+            )
+            return False
+        return True
+
+    def insert(self, model: "OzonModelBase", record: CoreModel) -> bool:
+        """
+        :param model: the record model
+        :param record: the record to insert, see OzonModelBase.new
+        :return: True if the record is queued
+        """
+        if not self.chk_model(model, record):
+            return False
+        if not record.rec_name or not model.name_allowed.match(
+            record.rec_name
+        ):
+            model.error_status(
+                _("Not allowed chars in field name: %s") % record.rec_name,
+                data=record.get_dict_json(),
+            )
+            return False
+        self.queue.append(("insert", model, record, False))
+        return True
+
+    def update(
+        self, model: "OzonModelBase", record: CoreModel, remove_mata=True
+    ) -> bool:
+        """
+        :param model: the record model
+        :param record: the record to update, only the assigned fields are
+                       written if the record is tracked (loaded from db)
+        :param remove_mata: do not update the metadata fields
+        :return: True if the record is queued
+        """
+        if not self.chk_model(model, record):
+            return False
+        self.queue.append(("update", model, record, remove_mata))
+        return True
+
+    def remove(self, model: "OzonModelBase", record: CoreModel) -> bool:
+        if not self.chk_model(model, record):
+            return False
+        self.queue.append(("remove", model, record, False))
+        return True
+
+    async def make_operations(self) -> dict[str, list]:
+        """
+        :return: for each collection the list of
+                 (queue index, op, model, record, db operation, doc)
+        """
+        now = datetime.now().isoformat()
+        # reserve the list_order values once per model
+        inserts = {}
+        for op, model, record, remove_mata in self.queue:
+            if op == "insert":
+                inserts.setdefault(model.name, []).append(model)
+        list_order = {}
+        for name, models in inserts.items():
+            list_order[name] = await models[0].reserve_list_order(len(models))
+        batches = {}
+        for i, (op, model, record, remove_mata) in enumerate(self.queue):
+            res = self.results.setdefault(model.data_model, BulkReturn())
+            try:
+                if op == "insert":
+                    doc = model.make_insert_doc(
+                        record, list_order[model.name], now
+                    )
+                    list_order[model.name] += 1
+                    operation = InsertOne(doc)
+                elif op == "update":
+                    doc = self.make_update_doc(model, record, now, remove_mata)
+                    operation = UpdateOne(
+                        model.version_domain(record),
+                        {"$set": doc, "$inc": {"doc_version": 1}},
+                    )
+                else:
+                    doc = record.rec_name_domain()
+                    operation = DeleteOne(doc)
+            except pydantic.ValidationError as e:
+                logger.error(f" Validation {e}")
+                res.errors.append(
+                    BulkError(
+                        index=i,
+                        rec_name=record.rec_name or "",
+                        error_type="validation",
+                        msg=_("Validation Error  %s ") % str(e),
+                    )
+                )
+                continue
+            batches.setdefault(model.data_model, []).append(
+                (i, op, model, record, operation, doc)
+            )
+        return batches
+
+    def make_update_doc(
+        self,
+        model: "OzonModelBase",
+        record: CoreModel,
+        update_datetime: str,
+        remove_mata=True,
+    ) -> dict:
+        if model.virtual:
+            to_save = model._make_from_dict(
+                copy.deepcopy(record.get_dict(compute_datetime=False))
+            )
+            to_save.pop("rec_name", None)
+            to_save.pop("doc_version", None)
+        else:
+            to_save = model.get_update_fields(record, remove_mata)
+        to_save["update_uid"] = model.orm.user_session.get("user.uid")
+        to_save["update_datetime"] = update_datetime
+        return to_save
+
+    async def write(self, data_model: str, batch: list, session=None):
+        res = self.results[data_model]
+        model = batch[0][2]
+        if session:
+            # the write concern is set on the transaction
+            coll = model.db.engine.get_collection(data_model)
+        else:
+            coll = model.get_collection(self.write_profile)
+        failed = set()
+        try:
+            result = await coll.bulk_write(
+                [item[4] for item in batch],
+                ordered=self.ordered,
+                session=session,
+            )
+            if not result.acknowledged:
+                self.written += batch
+                return
+            res.inserted = result.inserted_count
+            res.matched = result.matched_count
+            res.modified = result.modified_count
+            res.deleted = result.deleted_count
+        except BulkWriteError as e:
+            res.inserted = e.details.get("nInserted", 0)
+            res.matched = e.details.get("nMatched", 0)
+            res.modified = e.details.get("nModified", 0)
+            res.deleted = e.details.get("nRemoved", 0)
+            docs = [{"rec_name": item[3].rec_name} for item in batch]
+            for err in e.details.get("writeErrors", []):
+                failed.add(err["index"])
+                res.errors.append(
+                    model._bulk_write_error(batch[err["index"]][0], docs, err)
+                )
+            if self.ordered and failed:
+                for pos in range(max(failed) + 1, len(batch)):
+                    failed.add(pos)
+                    res.errors.append(
+                        BulkError(
+                            index=batch[pos][0],
+                            rec_name=batch[pos][3].rec_name or "",
+                            error_type="skipped",
+                            msg=_("Not saved"),
+                        )
+                    )
+            if session:
+                raise
+        written = [item for pos, item in enumerate(batch) if pos not in failed]
+        updates = [item for item in written if item[1] == "update"]
+        conflicts = {}
+        if res.matched < len(updates):
+            conflicts = await self.get_version_conflicts(
+                data_model, updates, session
+            )
+        self.written += [
+            item
+            for item in written
+            if not (item[1] == "update" and item[3].rec_name in conflicts)
+        ]
+        if conflicts:
+            rec_name, data = next(iter(conflicts.items()))
+            raise VersionConflictException(
+                detail=_("Record %s changed by another writer") % rec_name,
+                rec_name=rec_name,
+                version=data.get("doc_version") or 0,
+            )
+
+    async def after_write(self, written: list):
+        """
+        update the written records as insert/update with reload=False
+        """
+        for i, op, model, record, operation, doc in written:
+            if op == "insert":
+                record.create_datetime = datetime.fromisoformat(
+                    doc["create_datetime"]
+                )
+                record.data_value = doc.get("data_value", {})
+                record.track_changes()
+            elif op == "update" and record.get_stored_version() is not None:
+                record.doc_version = record.get_stored_version() + 1
+                record.track_changes()
+            if model.is_session_model and op != "insert":
+                await session_cache.invalidate(
+                    model.db.engine.name, record.get("token")
+                )
+
+    async def get_version_conflicts(
+        self, data_model: str, updates: list, session=None
+    ) -> dict:
+        """
+        :return: the current db data by rec_name of the versioned records
+                 not written, the update_datetime of the flush identifies
+                 the written records
+        """
+        versioned = [item for item in updates if item[2].versioned]
+        if not versioned:
+            return {}
+        coll = versioned[0][2].db.engine.get_collection(data_model)
+        current = {}
+        async for data in coll.find(
+            {"rec_name": {"$in": [item[3].rec_name for item in versioned]}},
+            projection=["rec_name", "doc_version", "update_datetime"],
+            session=session,
+        ):
+            current[data["rec_name"]] = data
+        conflicts = {}
+        for i, op, model, record, operation, doc in versioned:
+            data = current.get(record.rec_name)
+            if data and data.get("update_datetime") != doc["update_datetime"]:
+                conflicts[record.rec_name] = data
+        return conflicts
+
+    async def flush(self) -> dict[str, BulkReturn]:
+        """
+        write the queued operations, one bulk_write per collection
+        :return: the results by data_model
+        """
+        self.results = {}
+        batches = await self.make_operations()
+        self.clear()
+        self.written = []
+        aborted = False
+        invalid = any(res.errors for res in self.results.values())
+        if self.transaction and invalid:
+            # a record is not valid, nothing is written
+            aborted = True
+        elif not self.transaction:
+            try:
+                for data_model, batch in batches.items():
+                    await self.write(data_model, batch)
+            except VersionConflictException:
+                # the records written are not rolled back
+                await self.after_write(self.written)
+                raise
+        else:
+            client = self.env.db.client
+            async with await client.start_session() as session:
+                try:
+                    async with session.start_transaction(
+                        write_concern=write_profiles.get(self.write_profile)
+                    ):
+                        for data_model, batch in batches.items():
+                            await self.write(data_model, batch, session)
+                except BulkWriteError:
+                    aborted = True
+                except VersionConflictException:
+                    self.abort()
+                    raise
+        if aborted:
+            self.abort()
+        await self.after_write(self.written)
+        for res in self.results.values():
+            res.errors.sort(key=lambda x: x.index)
+            if res.errors and not aborted:
+                res.fail = True
+                res.msg = _("Saved with %s errors") % len(res.errors)
+        return self.results
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from ozonenv.core.BaseModels import BulkReturn, CoreModel
+
+if TYPE_CHECKING:
+    from ozonenv.core.OzonModel import OzonModelBase
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBuffer:
+    """
+    Write-behind buffer of the model updates, see
+    OzonModelBase.enable_write_buffer.
+    The fields of successive updates of a record are merged by rec_name
+    and written with one bulk_write when max_size records are pending,
+    flush_interval seconds after the first pending update or on flush().
+    The reads of the models on the same data_model flush the buffer first.
+    If the write fails the updates are kept and retried on the next flush.
+    """
+
+    def __init__(
+        self, model: "OzonModelBase", max_size=500, flush_interval=1.0
+    ):
+        self.model = model
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.pending: dict[str, dict] = {}
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.task: Optional[asyncio.Task] = None
+        self.result = BulkReturn()
+
+    def __len__(self):
+        return len(self.pending)
+
+    async def add(self, record: CoreModel, to_save: dict):
+        """
+        :param record: the updated record
+        :param to_save: the fields to set, merged with the pending ones
+        """
+        self.pending.setdefault(record.rec_name, {}).update(to_save)
+        if len(self.pending) >= self.max_size:
+            await self.flush()
+        elif not self.timer and self.flush_interval:
+            self.timer = asyncio.get_running_loop().call_later(
+                self.flush_interval, self.start_flush
+            )
+
+    def start_flush(self):
+        self.timer = None
+        if not self.task:
+            self.task = asyncio.create_task(self.timed_flush())
+
+    async def timed_flush(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f" write buffer flush {self.model.name} error {e}")
+            if self.pending and self.flush_interval and not self.timer:
+                # retry later, the updates are kept
+                self.timer = asyncio.get_running_loop().call_later(
+                    self.flush_interval, self.start_flush
+                )
+
+    def restore(self, pending: dict[str, dict]):
+        """
+        put back the updates of a failed write, the fields updated
+        meanwhile win
+        """
+        merged = {
+            rec_name: {**to_save, **self.pending.get(rec_name, {})}
+            for rec_name, to_save in pending.items()
+        }
+        for rec_name, to_save in self.pending.items():
+            merged.setdefault(rec_name, to_save)
+        self.pending = merged
+
+    def cancel_timer(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+    async def flush(self) -> BulkReturn:
+        """
+        write the pending updates
+        :return: BulkReturn with the matched and modified count
+        """
+        self.cancel_timer()
+        task, self.task = self.task, None
+        if task and task is not asyncio.current_task():
+            # a timed flush is running, wait it before writing
+            await task
+        res = BulkReturn()
+        if not self.pending:
+            return res
+        update_uid = self.model.orm.user_session.get("user.uid")
+        pending, self.pending = self.pending, {}
+        update_datetime = datetime.now().isoformat()
+        operations = []
+        for rec_name, to_save in pending.items():
+            to_save["update_uid"] = update_uid
+            to_save["update_datetime"] = update_datetime
+            operations.append(
+                UpdateOne(
+                    {"rec_name": rec_name},
+                    {"$set": to_save, "$inc": {"doc_version": 1}},
+                )
+            )
+        coll = self.model.get_collection()
+        try:
+            result = await coll.bulk_write(operations, ordered=False)
+            if result.acknowledged:
+                res.matched = result.matched_count
+                res.modified = result.modified_count
+        except BulkWriteError as e:
+            res.matched = e.details.get("nMatched", 0)
+            res.modified = e.details.get("nModified", 0)
+            names = [{"rec_name": rec_name} for rec_name in pending]
+            for err in e.details.get("writeErrors", []):
+                res.errors.append(
+                    self.model._bulk_write_error(err["index"], names, err)
+                )
+            res.fail = True
+        except Exception:
+            self.restore(pending)
+            raise
+        self.result = res
+        return res
@@ -1,16 +1,18 @@
-from redis import asyncio as aioredis
-from redis.asyncio.client import Redis
-from typing import Any
+from typing import Any, TYPE_CHECKING
 import logging
 from typing import Tuple
 from .coder import PickleCoder
 
+if TYPE_CHECKING:
+    # redis is imported by init_cache
+    from redis.asyncio.client import Redis
+
 
 # from aioredis import Redis
 
 
 class RedisBackend:
-    def __init__(self, redis: Redis):
+    def __init__(self, redis: "Redis"):
         self.redis = redis
         self.coder = PickleCoder
 
@@ -38,14 +40,14 @@ class RedisBackend:
 
 
 class OzonCache:
-    client: Redis = None
+    client: "Redis" = None
     cache: RedisBackend = None
 
 
 ioredis = OzonCache()
 
 
-async def get_redis() -> Redis:
+async def get_redis() -> "Redis":
     return ioredis.client
 
 
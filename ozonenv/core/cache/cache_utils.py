@@ -1,4 +1,3 @@
-from redis import asyncio as aioredis
 import logging
 from .cache import ioredis, get_redis, RedisBackend
 
@@ -6,6 +5,8 @@ logger = logging.getLogger(__name__)
 
 
 async def init_cache(url="redis://redis_cache"):
+    from redis import asyncio as aioredis
+
     logger.info("...")
     logger.info(f" start Redis Cache ..")
     ioredis.client = aioredis.from_url(
@@ -0,0 +1,120 @@
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from ozonenv.core.BaseModels import Session
+from .cache import ioredis
+
+logger = logging.getLogger(__name__)
+
+
+class SessionCache:
+    """
+    TTL + LRU cache of the user sessions loaded by OzonOrm.init_session.
+    The first tier is a per-process LRU, if the redis cache is initialized
+    (ioredis.cache) it is used as second tier shared between the workers.
+    Entries are stored per namespace (the db name) and token and never
+    outlive the session expire_datetime. The writes of the session model
+    invalidate the entries of this process and of redis, the per-process
+    tier of the other workers is stale until its ttl expires.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.items: OrderedDict[tuple[str, str], tuple[float, Session]] = (
+            OrderedDict()
+        )
+
+    @classmethod
+    def redis_key(cls, token: str) -> str:
+        return f"session:{token}"
+
+    @classmethod
+    def get_ttl(cls, session: Session, ttl: int, expire_hours: int = 0) -> int:
+        """
+        :param session: the session to store
+        :param ttl: the max ttl in seconds
+        :param expire_hours: Settings.session_expire_hours
+        :return: the ttl in seconds, <= 0 if the session must not be cached
+        """
+        if expire_hours:
+            ttl = min(ttl, expire_hours * 3600)
+        expire_at = session.expire_datetime
+        left = (expire_at - datetime.now(expire_at.tzinfo)).total_seconds()
+        return int(min(ttl, left))
+
+    async def get(self, namespace: str, token: str) -> Optional[Session]:
+        key = (namespace, token)
+        item = self.items.get(key)
+        if item:
+            expire_at, session = item
+            if expire_at > time.monotonic():
+                self.items.move_to_end(key)
+                return session.model_copy(deep=True)
+            self.items.pop(key, None)
+        if not ioredis.cache:
+            return None
+        try:
+            ttl, value = await ioredis.cache.get_with_ttl(
+                namespace, self.redis_key(token)
+            )
+        except Exception as e:
+            logger.warning(f"session cache redis get error {e}")
+            return None
+        if not value or ttl <= 0:
+            return None
+        session = ioredis.cache.coder.decode(value)
+        self.set_local(namespace, token, session, ttl)
+        return session.model_copy(deep=True)
+
+    def set_local(self, namespace: str, token: str, session: Session, ttl):
+        key = (namespace, token)
+        self.items[key] = (time.monotonic() + ttl, session)
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    async def set(
+        self, namespace: str, token: str, session: Session, ttl: int
+    ):
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        session = session.model_copy(deep=True)
+        self.set_local(namespace, token, session, ttl)
+        if not ioredis.cache:
+            return
+        try:
+            await ioredis.cache.set(
+                namespace, self.redis_key(token), session, expire=ttl
+            )
+        except Exception as e:
+            logger.warning(f"session cache redis set error {e}")
+
+    async def invalidate(self, namespace: str, token: str):
+        self.items.pop((namespace, token), None)
+        if not ioredis.cache:
+            return
+        try:
+            await ioredis.cache.clear(
+                key=f"{namespace}:{self.redis_key(token)}"
+            )
+        except Exception as e:
+            logger.warning(f"session cache redis delete error {e}")
+
+    async def invalidate_all(self, namespace: str):
+        for key in [k for k in self.items if k[0] == namespace]:
+            self.items.pop(key, None)
+        if not ioredis.cache:
+            return
+        try:
+            await ioredis.cache.clear(app_code=f"{namespace}:session")
+        except Exception as e:
+            logger.warning(f"session cache redis clear error {e}")
+
+    def clear(self):
+        self.items.clear()
+
+
+session_cache = SessionCache()
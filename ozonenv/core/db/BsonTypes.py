@@ -59,11 +59,99 @@ class JsonEncoder(json.JSONEncoder):
             return str(o)
         if isinstance(o, (datetime.datetime, datetime.date, datetime.time)):
             return o.isoformat()
-        elif isinstance(o, timedelta):
+        elif isinstance(o, datetime.timedelta):
             return (datetime.datetime.min + o).time().isoformat()
         return super().default(o)
 
 
+_DEC128_SPECIAL = 0x7800000000000000  # nan and infinity
+_DEC128_EXPONENT_MASK = 0x6000000000000000
+_DEC128_MAX_COEFFICIENT = 10**34
+
+
+def _decimal128_to_float(o: bson.decimal128.Decimal128) -> float:
+    # float(o.to_decimal()) without building the Decimal, both are the
+    # correctly rounded float of the same decimal value
+    bid = o.bid
+    high = int.from_bytes(bid[8:], "little")
+    if (
+        high & _DEC128_SPECIAL == _DEC128_SPECIAL
+        or high & _DEC128_EXPONENT_MASK == _DEC128_EXPONENT_MASK
+    ):
+        return float(o.to_decimal())
+    coefficient = ((high & 0x1FFFFFFFFFFFF) << 64) | int.from_bytes(
+        bid[:8], "little"
+    )
+    if coefficient >= _DEC128_MAX_COEFFICIENT:
+        return float(o.to_decimal())
+    exponent = ((high & 0x7FFF800000000000) >> 49) - 6176
+    sign = "-" if high >> 63 else ""
+    return float(f"{sign}{coefficient}e{exponent}")
+
+
+def _timedelta_to_python(o):
+    return (datetime.datetime.min + o).time().isoformat()
+
+
+# converters of the non json types, same output of JsonEncoder
+_BSON_CONVERTERS = {
+    bson.decimal128.Decimal128: _decimal128_to_float,
+    bson.objectid.ObjectId: str,
+    datetime.datetime: datetime.datetime.isoformat,
+    datetime.date: datetime.date.isoformat,
+    datetime.time: datetime.time.isoformat,
+    datetime.timedelta: _timedelta_to_python,
+    bson.int64.Int64: int,
+}
+_NATIVE_TYPES = frozenset((str, int, float, bool, type(None)))
+
+
+def bson_to_python(o):
+    """
+    convert a db document to plain python values in a single pass,
+    the result is the same of
+    json.loads(json.dumps(o, cls=JsonEncoder)) without the json encoding
+    """
+    cls = o.__class__
+    if cls is dict:
+        res = {}
+        for k, v in o.items():
+            vcls = v.__class__
+            if vcls in _NATIVE_TYPES:
+                res[k] = v
+            elif vcls in _BSON_CONVERTERS:
+                res[k] = _BSON_CONVERTERS[vcls](v)
+            else:
+                res[k] = bson_to_python(v)
+        return res
+    if cls is list or cls is tuple:
+        return [
+            v if v.__class__ in _NATIVE_TYPES else bson_to_python(v) for v in o
+        ]
+    if cls in _NATIVE_TYPES:
+        return o
+    if cls in _BSON_CONVERTERS:
+        return _BSON_CONVERTERS[cls](o)
+    return _bson_to_python_subclass(o)
+
+
+def _bson_to_python_subclass(o):
+    if isinstance(o, dict):
+        return bson_to_python(dict(o))
+    if isinstance(o, (list, tuple)):
+        return bson_to_python(list(o))
+    # the json types subclasses (bool is an int subclass)
+    for cls in (str, bool, int, float):
+        if isinstance(o, cls):
+            return cls(o)
+    for cls, converter in _BSON_CONVERTERS.items():
+        if isinstance(o, cls):
+            return converter(o)
+    raise TypeError(
+        f"Object of type {o.__class__.__name__} is not JSON serializable"
+    )
+
+
 BSON_TYPES_ENCODERS = {
     bson.ObjectId: str,
     bson.decimal128.Decimal128: lambda x: float(x.to_decimal()),
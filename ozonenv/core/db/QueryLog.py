@@ -0,0 +1,140 @@
+import logging
+import time as time_
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# the plan stages that read the documents through an index
+index_stages = {
+    "IXSCAN",
+    "EXPRESS_IXSCAN",
+    "IDHACK",
+    "EXPRESS_IDHACK",
+    "COUNT_SCAN",
+    "DISTINCT_SCAN",
+}
+
+
+def query_shape(query: Any) -> Any:
+    """
+    :param query: a mongo domain or pipeline
+    :return: the query with the values replaced by "?", the field names
+             and the operators are kept
+    """
+    if isinstance(query, dict):
+        return {key: query_shape(value) for key, value in query.items()}
+    if isinstance(query, list) and any(
+        isinstance(item, (dict, list)) for item in query
+    ):
+        return [query_shape(item) for item in query]
+    return "?"
+
+
+def plan_summary(plan: Any) -> tuple[list[str], list[str]]:
+    """
+    :param plan: the winning plan of an explain
+    :return: the stage names and the index names of the plan tree
+    """
+    stages = []
+    indexes = []
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, list):
+            nodes.extend(reversed(node))
+            continue
+        if not isinstance(node, dict):
+            continue
+        if isinstance(node.get("stage"), str):
+            stages.append(node["stage"])
+        if node.get("indexName"):
+            indexes.append(node["indexName"])
+        nodes.extend(
+            value
+            for value in reversed(node.values())
+            if isinstance(value, (dict, list))
+        )
+    return stages, indexes
+
+
+def winning_plan(explain: dict) -> dict:
+    """
+    :param explain: the result of the explain command
+    :return: the winning plan, of the first shard on a sharded cluster
+    """
+    planner = explain.get("queryPlanner", {})
+    plan = planner.get("winningPlan", {})
+    if "shards" in plan:
+        plan = (plan["shards"] or [{}])[0].get("winningPlan", {})
+    # the slot based engine nests the classic plan in queryPlan
+    return plan.get("queryPlan", plan)
+
+
+@dataclass
+class SlowQuery:
+    model: str
+    operation: str
+    shape: Any
+    sort: dict
+    duration_ms: float
+    docs: int
+    timestamp: datetime = field(default_factory=datetime.now)
+
+
+class QueryLog:
+    """
+    Log of the slow reads of the models (find_raw, aggregate_raw,
+    count_by_filter, distinct). A query is recorded if it runs for at
+    least threshold_ms milliseconds, 0 records every query and a negative
+    threshold disables the log. The domain is stored as shape, without
+    the values. The last maxsize queries are kept in entries.
+    """
+
+    def __init__(self, threshold_ms: float = 100, maxsize: int = 100):
+        self.threshold_ms = threshold_ms
+        self.entries: deque[SlowQuery] = deque(maxlen=maxsize)
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms >= 0
+
+    def record(
+        self,
+        model: str,
+        operation: str,
+        query: Any,
+        start_time: float,
+        docs: int = 0,
+        sort: dict = None,
+    ):
+        """
+        :param start_time: the time_.monotonic() before the query
+        :param docs: the documents returned
+        """
+        if not self.enabled:
+            return
+        duration_ms = (time_.monotonic() - start_time) * 1000
+        if duration_ms < self.threshold_ms:
+            return
+        entry = SlowQuery(
+            model=model,
+            operation=operation,
+            shape=query_shape(query),
+            sort=sort or {},
+            duration_ms=round(duration_ms, 3),
+            docs=docs,
+        )
+        self.entries.append(entry)
+        logger.warning(
+            f"slow query {model} {operation} {entry.duration_ms}ms "
+            f"docs {docs} shape {entry.shape} sort {entry.sort}"
+        )
+
+    def clear(self):
+        self.entries.clear()
+
+
+query_log = QueryLog()
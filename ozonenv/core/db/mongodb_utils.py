@@ -1,18 +1,117 @@
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase, \
-    AsyncIOMotorCollection
+import base64
 import logging
+from typing import TYPE_CHECKING, Any, Optional
+
+from bson import json_util
 from pydantic import BaseModel
 from pymongo.collection import Collection
 from pymongo.typings import _DocumentType
 from pymongo.write_concern import WriteConcern
 
+from ozonenv.core.db.QueryLog import query_log
+
+if TYPE_CHECKING:
+    # motor is imported by connect_to_mongo
+    from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+
 
 logger = logging.getLogger("asyncio")
 
+# sequences collection (list_order), not a model collection
+counters_collection = "_ozon_counters"
+
+# write concern by profile name, see OzonModelBase.get_collection
+write_profiles = {
+    # majority of the nodes and journal, the db default
+    "durable": WriteConcern(w="majority", j=True, wtimeout=5000),
+    # primary only, no journal: derived data, bulk re-imports
+    "fast": WriteConcern(w=1, j=False),
+    # fire and forget: caches, staging collections
+    "unacknowledged": WriteConcern(w=0),
+}
+
+
+def __getattr__(name):
+    # motor classes are imported on first use
+    if name in (
+        "AsyncIOMotorClient",
+        "AsyncIOMotorDatabase",
+        "AsyncIOMotorCollection",
+    ):
+        from motor import motor_asyncio
+
+        return getattr(motor_asyncio, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def make_page_token(keys: list[tuple], values: list) -> str:
+    """
+    :param keys: the sort keys, [(field, direction)]
+    :param values: the sort keys values of the last record of the page
+    :return: the opaque token of the next page
+    """
+    data = json_util.dumps({"k": keys, "v": values})
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def parse_page_token(token: str, keys: list[tuple]) -> list:
+    """
+    :return: the values of the sort keys stored in the token
+    :raise ValueError: if the token is not valid or the sort keys changed
+    """
+    try:
+        data = json_util.loads(base64.urlsafe_b64decode(token.encode()))
+    except Exception as e:
+        raise ValueError(f"invalid page token {e}")
+    if not isinstance(data, dict) or data.get("k") != [
+        list(key) for key in keys
+    ]:
+        raise ValueError("page token sort keys do not match")
+    return data["v"]
+
+
+def after_value(key: str, direction: int, value: Any) -> Optional[dict]:
+    """
+    :return: the predicate of the key values after value in the sort
+             direction, None if there are none; null and missing values
+             sort before any other value
+    """
+    if value is None:
+        return {key: {"$ne": None}} if direction == 1 else None
+    if direction == 1:
+        return {key: {"$gt": value}}
+    return {"$or": [{key: {"$lt": value}}, {key: None}]}
+
+
+def keyset_domain(keys: list[tuple], values: list) -> dict:
+    """
+    :return: the range predicate of the records after values in the
+             keys sort order, eg. for list_order asc, _id asc:
+             {"$or": [{"list_order": {"$gt": v0}},
+                      {"list_order": v0, "_id": {"$gt": v1}}]}
+    """
+    branches = []
+    for i, (key, direction) in enumerate(keys):
+        after = after_value(key, direction, values[i])
+        if after is None:
+            continue
+        branch = {k: values[j] for j, (k, _d) in enumerate(keys[:i])}
+        branch.update(after)
+        branches.append(branch)
+    return {"$or": branches}
+
+
+def get_path_value(data: dict, path: str) -> Any:
+    for key in path.split("."):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
 
 class Mongo:
-    client: AsyncIOMotorClient = None
-    engine: AsyncIOMotorDatabase = None
+    client: "AsyncIOMotorClient" = None
+    engine: "AsyncIOMotorDatabase" = None
 
 
 class DbSettings(BaseModel):
@@ -21,12 +120,17 @@ class DbSettings(BaseModel):
     mongo_url: str
     mongo_db: str
     mongo_replica: str = ""
+    mongo_write_profile: str = "durable"
+    # log the reads slower than this, 0 all reads, < 0 disabled
+    mongo_slow_query_ms: int = 100
 
 
 db = Mongo()
 
 
 async def connect_to_mongo(settings: DbSettings):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
     logger.info("...")
     mongocfg = f"mongodb://{settings.mongo_user}:{settings.mongo_pass}@{settings.mongo_url}"
     logger.info(f" DB Url {settings.mongo_url} DB {settings.mongo_db}  ..")
@@ -44,11 +148,8 @@ async def connect_to_mongo(settings: DbSettings):
             maxIdleTimeMS=10000,
             socketTimeoutMS=None,
             minPoolSize=20)
-    write_concern = WriteConcern(
-        w="majority",  # Conferma da majority dei nodi
-        j=True,  # Attendere il journal
-        wtimeout=5000,  # Timeout in millisecondi
-    )
+    write_concern = write_profiles[settings.mongo_write_profile]
+    query_log.threshold_ms = settings.mongo_slow_query_ms
     db.engine = db.client.get_database(settings.mongo_db, write_concern=write_concern)  #
     logging.info("connected new connection")
     return db
@@ -13,3 +13,41 @@ class SessionException(Exception):
     def __repr__(self) -> str:
         class_name = self.__class__.__name__
         return f"{class_name}(detail={self.detail!r})"
+
+
+class VersionConflictException(Exception):
+    def __init__(
+        self,
+        detail: typing.Optional[str] = None,
+        rec_name: str = "",
+        version: int = 0,
+    ) -> None:
+        if detail is None:
+            detail = "Record changed by another writer"
+        self.detail = detail
+        self.rec_name = rec_name
+        self.version = version
+
+    def __repr__(self) -> str:
+        class_name = self.__class__.__name__
+        return (
+            f"{class_name}(detail={self.detail!r}, "
+            f"rec_name={self.rec_name!r}, version={self.version!r})"
+        )
+
+
+class FieldNotLoaded(AttributeError):
+    """
+    raised accessing a field not loaded in a partial record,
+    see OzonModelBase.find fields
+    """
+
+    def __init__(self, field: str = "", model: str = "") -> None:
+        self.field = field
+        self.model = model
+        self.detail = f"Field {field} not loaded in the partial {model} record"
+        super().__init__(self.detail)
+
+    def __repr__(self) -> str:
+        class_name = self.__class__.__name__
+        return f"{class_name}(field={self.field!r}, model={self.model!r})"
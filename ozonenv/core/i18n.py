@@ -1,7 +1,5 @@
 import gettext as support
 from pathlib import Path
-from babel import Locale
-from babel.messages.frontend import CommandLineInterface
 import os
 
 i18ncwd = Path(__file__).cwd()
@@ -46,6 +44,8 @@ class I18n(metaclass=Singleton):
     def update_translations(self, lang):
         if lang not in self.active_lanuages:
             self.active_lanuages.append(lang)
+        from babel.messages.frontend import CommandLineInterface
+
         # make *.mo files from lan.po file
         CommandLineInterface().run(
             argv=["pybabel", "compile", "-d", f"{self.localedir}"]
@@ -67,6 +67,8 @@ class I18n(metaclass=Singleton):
 
     def _extract_base_pot(self, resource_code_folders=[]):
         # pybabel extract -F babel-mapping.ini -o locale/messages.pot ./
+        from babel.messages.frontend import CommandLineInterface
+
         self.resource_paths = self.resource_paths + resource_code_folders
         for path in self.resource_paths:
             CommandLineInterface().run(
@@ -81,6 +83,8 @@ class I18n(metaclass=Singleton):
 
     def _make_pot_lang(self, lang):
         # pybabel init -d locale -l it -i locale/messages.pot
+        from babel.messages.frontend import CommandLineInterface
+
         CommandLineInterface().run(
             argv=[
                 "pybabel",
@@ -99,6 +103,8 @@ class I18n(metaclass=Singleton):
         strings.
         .. versionadded:: 0.6
         """
+        from babel import Locale
+
         result = []
 
         for dirname in self.localedir:
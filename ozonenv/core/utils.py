@@ -4,7 +4,16 @@ import re
 import aiofiles
 import aiofiles.os
 import json
-import httpx
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+
+async def run_in_threadpool(func: Callable[..., T], *args, **kwargs) -> T:
+    # starlette (and anyio) are imported on first use
+    from starlette.concurrency import run_in_threadpool as _run_in_threadpool
+
+    return await _run_in_threadpool(func, *args, **kwargs)
 
 
 async def read_json_file(file_path):
@@ -13,7 +22,16 @@ async def read_json_file(file_path):
     return json.loads(data)
 
 
+def parse_datetime(timestr, **kwargs):
+    # dateutil is imported on first use
+    from dateutil.parser import parse
+
+    return parse(timestr, **kwargs)
+
+
 def base64_encode_url(url):
+    import httpx
+
     content = httpx.get(url).content
     tf = tempfile.TemporaryFile()
     tf.write(content)
@@ -6,6 +6,7 @@ from dateutil.parser import *
 
 from ozonenv.OzonEnv import OzonEnv
 from ozonenv.core.BaseModels import defaultdt
+from ozonenv.core.ModelRegistry import model_registry
 from ozonenv.core.exceptions import SessionException
 from test_common import *
 
@@ -96,6 +97,28 @@ async def test_component_test_form_1_init():
     await env.close_db()
 
 
+@pytestmark
+async def test_model_code_independent_of_cwd(tmp_path, monkeypatch):
+    env = OzonEnv()
+    await env.init_env()
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    component = await env.orm.load_component('test_form_1')
+    mod = env.orm.cls_model(
+        'test_form_1', env.orm, schema=component.get_dict_copy()
+    )
+    mod.setup_model()
+    code = env.orm.make_model_code(mod, "1970-01-01T00:00:00")
+    # a formatter config in the working directory is not used
+    (tmp_path / "pyproject.toml").write_text(
+        "[tool.black]\nline-length = 20\n"
+        "[tool.isort]\nforce_single_line = true\n"
+    )
+    monkeypatch.chdir(tmp_path)
+    assert env.orm.make_model_code(mod, "1970-01-01T00:00:00") == code
+    await env.close_db()
+
+
 @pytestmark
 async def test_component_test_form_1_raw_update():
     env = OzonEnv()
@@ -156,6 +179,17 @@ async def test_component_test_form_1_load():
     assert component.owner_uid == "admin"
     assert len(component.components) == 12
     assert component.get(f'components.{3}.label') == "Panel"
+    item = model_registry.get(env.models_folder, 'test_form_1')
+    assert item.version == component.update_datetime.isoformat()
+    assert env.get('test_form_1').model is item.model
+    # the schema metadata is kept with the registry model
+    assert item.mm.model_name == 'test_form_1'
+    assert env.get('test_form_1').mm is item.mm
+    module_path = f"{env.models_folder}/test_form_1.py"
+    mtime = os.path.getmtime(module_path)
+    await env.orm.update_model(component.get_dict_copy(), component)
+    assert os.path.getmtime(module_path) == mtime
+    assert env.get('test_form_1').model.get_version() == item.version
     await env.close_env()
 
 
@@ -287,12 +321,15 @@ async def test_test_form_1_copy_record():
     env.params = {"current_session_token": "BA6BA930"}
     await env.session_app()
     test_form_1_model = await env.add_model('test_form_1')
+    list_order = await test_form_1_model.reserve_list_order()
     test_form_1_copy = await test_form_1_model.copy({'rec_name': 'first_form'})
     assert test_form_1_copy.get("rec_name") == f"first_form_copy"
     assert test_form_1_copy.get("owner_uid") == env.user_session.get('uid')
     assert test_form_1_copy.create_datetime.date() == datetime.now().date()
     test_form_1_copy = await test_form_1_model.insert(test_form_1_copy)
     assert test_form_1_copy.is_error() is False
+    # a single sequence value is used by copy and insert
+    assert test_form_1_copy.list_order == list_order + 1
     # test rec_name --> model.ids
     await env.close_env()
 
@@ -1,6 +1,16 @@
+import asyncio
+from datetime import date, datetime
+
+from pydantic import BaseModel
+
 from ozonenv.OzonEnv import OzonEnv
-from ozonenv.core.BaseModels import CoreModel
-from ozonenv.core.exceptions import SessionException
+from ozonenv.core.BaseModels import BasicModel, CoreModel
+from ozonenv.core.db.QueryLog import query_log
+from ozonenv.core.exceptions import (
+    FieldNotLoaded,
+    SessionException,
+    VersionConflictException,
+)
 from test_common import *
 
 pytestmark = pytest.mark.asyncio
@@ -296,3 +306,860 @@ async def test_set_to_delete_product():
     res = await product_model.set_active(products[0])
     assert res.rec_name == "prod2"
     assert res.deleted == 0
+
+
+@pytestmark
+async def test_products_insert_many():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    product_model = env.get('prodotti')
+    records = []
+    for i in range(5):
+        records.append(
+            await product_model.new(
+                {
+                    "rec_name": f"bulk{i}",
+                    "label": f"Bulk{i}",
+                    "quantity": i,
+                    "price": "10.5"
+                }
+            )
+        )
+    records.insert(
+        2, await product_model.new({"rec_name": "prod1", "label": "Dup"})
+    )
+    not_allowed = await product_model.new(
+        {"rec_name": "bulk_na", "label": "Not Allowed"}
+    )
+    not_allowed.rec_name = "bulk na!"
+    records.append(not_allowed)
+    res = await product_model.insert_many(records, return_records=True)
+    assert res.fail is True
+    assert res.inserted == 5
+    assert [(e.index, e.error_type) for e in res.errors] == [
+        (2, "duplicate"), (6, "not_allowed")
+    ]
+    assert res.errors[0].rec_name == "prod1"
+    assert [r.rec_name for r in res.records] == [
+        f"bulk{i}" for i in range(5)
+    ]
+    assert res.records[0].price == 10.5
+    list_orders = [r.list_order for r in res.records]
+    assert list_orders == sorted(set(list_orders))
+    product = await product_model.load({"rec_name": "prod1"})
+    assert product.label == "Product1"
+
+    records = [
+        await product_model.new({"rec_name": "bulk_o0", "label": "O0"}),
+        await product_model.new({"rec_name": "bulk0", "label": "Dup"}),
+        await product_model.new({"rec_name": "bulk_o1", "label": "O1"}),
+    ]
+    res = await product_model.insert_many(records, ordered=True)
+    assert res.inserted == 1
+    assert [(e.index, e.error_type) for e in res.errors] == [
+        (1, "duplicate"), (2, "skipped")
+    ]
+    assert res.records == []
+    assert await product_model.count(
+        {"rec_name": {"$regex": "^bulk"}}
+    ) == 6
+    await product_model.remove_all({"rec_name": {"$regex": "^bulk"}})
+    await env.close_env()
+
+
+@pytestmark
+async def test_products_upsert_many():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    product_model = env.get('prodotti')
+    prod1 = await product_model.load({"rec_name": "prod1"})
+    res = await product_model.upsert_many(
+        [
+            {"rec_name": "upsert0", "label": "Upsert0", "price": "1.5"},
+            {
+                "rec_name": "prod1",
+                "label": "Product1 Upsert",
+                "quantity": 1,
+                "price": "20.1"
+            },
+            {"rec_name": "upsert1", "label": "Upsert1", "price": "2.5"},
+            {"rec_name": "upsert 2!", "label": "Not Allowed"},
+        ],
+        return_records=True,
+    )
+    assert res.fail is True
+    assert res.inserted == 2
+    assert res.matched == 1
+    assert res.modified == 1
+    assert [(e.index, e.error_type) for e in res.errors] == [
+        (3, "not_allowed")
+    ]
+    assert sorted(r.rec_name for r in res.records) == [
+        "prod1", "upsert0", "upsert1"
+    ]
+    product = await product_model.load({"rec_name": "prod1"})
+    assert product.label == "Product1 Upsert"
+    assert product.list_order == prod1.list_order
+    assert product.create_datetime == prod1.create_datetime
+    assert product.update_datetime > prod1.create_datetime
+    product = await product_model.load({"rec_name": "upsert1"})
+    assert product.price == 2.5
+    assert product.owner_uid == "admin"
+    assert product.active is True
+    res = await product_model.upsert_many(
+        [{"rec_name": "prod1", "label": "Product1", "price": "20.1"}]
+    )
+    assert res.fail is False
+    assert res.inserted == 0
+    assert res.matched == 1
+    assert res.records == []
+    await product_model.remove_all({"rec_name": {"$regex": "^upsert"}})
+    await env.close_env()
+
+
+@pytestmark
+async def test_products_list_order_sequence():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    assert "_ozon_counters" not in await env.orm.get_collections_names()
+    product_model = env.get('prodotti')
+    products = await product_model.find({}, sort="list_order:desc")
+    first = await product_model.reserve_list_order(3)
+    assert first > products[0].list_order
+    assert await product_model.reserve_list_order() == first + 3
+    prod = await product_model.new(
+        {"rec_name": "seq0", "label": "Seq0", "price": "1.0"}
+    )
+    prod = await product_model.insert(prod)
+    assert prod.list_order == first + 4
+    await product_model.remove(prod)
+    await env.close_env()
+
+
+@pytestmark
+async def test_products_write_without_reload():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    product_model = env.get('prodotti')
+    prod = await product_model.new(
+        {
+            "rec_name": "noreload0",
+            "label": "NoReload0",
+            "quantity": 2,
+            "price": "3.5"
+        }
+    )
+    saved = await product_model.insert(prod, reload=False)
+    assert saved is prod
+    assert isinstance(saved.create_datetime, datetime)
+    assert saved.owner_uid == "admin"
+    loaded = await product_model.load({"rec_name": "noreload0"})
+    assert loaded.create_datetime == saved.create_datetime
+    assert loaded.data_value == saved.data_value
+    assert loaded.list_order == saved.list_order
+    product_model.reload_on_write = False
+    loaded.label = "NoReload Updated"
+    updated = await product_model.update(loaded)
+    assert updated.label == "NoReload Updated"
+    assert updated.update_uid == "admin"
+    assert updated.update_datetime > saved.create_datetime
+    assert updated.price == 3.5
+    deleted = await product_model.set_to_delete(updated)
+    assert deleted.deleted > 0
+    product_model.reload_on_write = True
+    loaded = await product_model.load({"rec_name": "noreload0"})
+    assert loaded.deleted == deleted.deleted
+    await product_model.remove(loaded)
+    await env.close_env()
+
+
+@pytestmark
+async def test_products_update_dirty_fields():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    product_model = env.get('prodotti')
+    product = await product_model.load({"rec_name": "prod3"})
+    assert product.get_dirty_fields() == set()
+    await env.get_collection("prodotti").update_one(
+        {"rec_name": "prod3"}, {"$set": {"quantity": 33}}
+    )
+    product.label = "Product3 Dirty"
+    assert product.get_dirty_fields() == {"label"}
+    res = await product_model.update(product)
+    assert res.label == "Product3 Dirty"
+    # not assigned fields are not written
+    assert res.quantity == 33
+    assert product.get_dirty_fields() == set()
+    product.mark_dirty("quantity")
+    assert product.get_dirty_fields() == {"quantity"}
+    # records not loaded from db are saved with the diff of the db record
+    product = await product_model.new(
+        {
+            "rec_name": "prod3",
+            "label": "Product3",
+            "quantity": 3,
+            "price": "20.1"
+        }
+    )
+    assert product.get_dirty_fields() is None
+    res = await product_model.update(product)
+    assert res.label == "Product3"
+    assert res.quantity == 3
+    await env.close_env()
+
+
+class Address(BaseModel):
+    city: str = ""
+
+
+class Contact(BasicModel):
+    tags: list[str] = []
+    addr: Address = Address()
+
+
+@pytestmark
+async def test_update_changed_in_place():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    contact_model = await env.orm.add_static_model('contact', Contact)
+    contact = await contact_model.new(
+        {"rec_name": "contact1", "tags": ["a"], "addr": {"city": "x"}}
+    )
+    await contact_model.insert(contact)
+    contact = await contact_model.load({"rec_name": "contact1"})
+    # not assigned, changed in place
+    contact.tags.append("b")
+    contact.addr.city = "y"
+    assert contact.get_dirty_fields() == {"tags", "addr"}
+    await contact_model.update(contact)
+    contact = await contact_model.load({"rec_name": "contact1"})
+    assert contact.tags == ["a", "b"]
+    assert contact.addr.city == "y"
+    await env.get_collection("contact").update_one(
+        {"rec_name": "contact1"}, {"$set": {"tags": ["c"]}}
+    )
+    contact.addr.city = "z"
+    assert contact.get_dirty_fields() == {"addr"}
+    await contact_model.update(contact)
+    contact = await contact_model.load({"rec_name": "contact1"})
+    # the containers not changed are not written
+    assert contact.tags == ["c"]
+    assert contact.addr.city == "z"
+    await env.get_collection("contact").drop()
+    await env.close_env()
+
+
+@pytestmark
+async def test_products_versioned_update():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    product_model = env.get('prodotti')
+    product_model.versioned = True
+    writer_a = await product_model.load({"rec_name": "prod4"})
+    writer_b = await product_model.load({"rec_name": "prod4"})
+    version = writer_a.doc_version
+    writer_a.label = "Product4 A"
+    res = await product_model.update(writer_a)
+    assert res.doc_version == version + 1
+    assert writer_a.doc_version == version + 1
+    writer_b.label = "Product4 B"
+    with pytest.raises(VersionConflictException) as exc:
+        await product_model.update(writer_b, reload=False)
+    assert exc.value.rec_name == "prod4"
+    assert exc.value.version == version + 1
+    product = await product_model.load({"rec_name": "prod4"})
+    assert product.label == "Product4 A"
+    # retry on the current version
+    writer_b = await product_model.load({"rec_name": "prod4"})
+    writer_b.label = "Product4"
+    res = await product_model.update(writer_b, reload=False)
+    assert res.label == "Product4"
+    assert res.doc_version == version + 2
+    stored = await env.get_collection("prodotti").find_one(
+        {"rec_name": "prod4"}
+    )
+    # the records not read from db are not checked
+    product = await product_model.new(
+        {"rec_name": "prod4", "label": "Product4 New", "price": "1.0"}
+    )
+    res = await product_model.update(product)
+    assert res.label == "Product4 New"
+    res = await product_model.upsert(
+        {"rec_name": "prod4", "label": "Product4", "price": "1.0"}
+    )
+    assert res.label == "Product4"
+    assert res.doc_version == version + 4
+    async with env.unit_of_work() as uow:
+        product = await product_model.new(
+            {"rec_name": "prod4", "label": "Product4 Uow", "price": "1.0"}
+        )
+        uow.update(product_model, product)
+    assert not uow.fail
+    assert product.get_stored_version() is None
+    product = await product_model.load({"rec_name": "prod4"})
+    assert product.label == "Product4 Uow"
+    await env.get_collection("prodotti").replace_one(
+        {"rec_name": "prod4"}, stored
+    )
+    product_model.versioned = False
+    await env.close_env()
+
+
+@pytestmark
+async def test_products_unit_of_work():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    product_model = env.get('prodotti')
+    user_model = env.get('user')
+    product = await product_model.load({"rec_name": "prod2"})
+    label = product.label
+    async with env.unit_of_work() as uow:
+        for i in range(3):
+            row = await product_model.new(
+                {"rec_name": f"uow{i}", "label": f"Uow{i}", "quantity": i}
+            )
+            assert uow.insert(product_model, row) is True
+        user = await user_model.new(
+            {"rec_name": "uow_user", "uid": "uow_user", "password": "x"}
+        )
+        uow.insert(user_model, user)
+        product.label = "Product2 Uow"
+        uow.update(product_model, product)
+        assert await product_model.count({"rec_name": "uow0"}) == 0
+    assert uow.fail is False
+    assert uow.results["prodotti"].inserted == 3
+    assert uow.results["prodotti"].modified == 1
+    assert uow.results["user"].inserted == 1
+    rows = await product_model.find(
+        {"rec_name": {"$regex": "^uow"}}, sort="list_order:asc"
+    )
+    assert [r.rec_name for r in rows] == ["uow0", "uow1", "uow2"]
+    assert rows[0].list_order < rows[1].list_order < rows[2].list_order
+    stored = await product_model.load({"rec_name": "prod2"})
+    assert stored.label == "Product2 Uow"
+    assert stored.doc_version == product.doc_version
+
+    # discarded if the block raises
+    with pytest.raises(ValueError):
+        async with env.unit_of_work() as uow:
+            uow.remove(product_model, rows[0])
+            raise ValueError("discard")
+    assert await product_model.count({"rec_name": "uow0"}) == 1
+
+    async with env.unit_of_work() as uow:
+        dup = await product_model.new({"rec_name": "uow0", "label": "Dup"})
+        uow.insert(product_model, dup)
+        uow.remove(product_model, rows[1])
+        product.label = label
+        uow.update(product_model, product)
+    res = uow.results["prodotti"]
+    assert res.fail is True
+    assert [(e.index, e.error_type) for e in res.errors] == [
+        (0, "duplicate"), (1, "skipped"), (2, "skipped")
+    ]
+
+    async with env.unit_of_work(ordered=False) as uow:
+        for r in rows:
+            uow.remove(product_model, r)
+        uow.remove(user_model, user)
+        uow.update(product_model, product)
+    assert uow.results["prodotti"].deleted == 3
+    assert uow.results["user"].deleted == 1
+    assert await product_model.count({"rec_name": {"$regex": "^uow"}}) == 0
+    stored = await product_model.load({"rec_name": "prod2"})
+    assert stored.label == label
+    await env.close_env()
+
+
+@pytestmark
+async def test_unit_of_work_conflict_after_write():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    product_model = env.get('prodotti')
+    product_model.versioned = True
+    user_model = env.get('user')
+    user = await user_model.load({"uid": "admin"})
+    version = user.doc_version
+    full_name = user.full_name
+    product = await product_model.load({"rec_name": "prod5"})
+    await env.get_collection("prodotti").update_one(
+        {"rec_name": "prod5"}, {"$inc": {"doc_version": 1}}
+    )
+    with pytest.raises(VersionConflictException):
+        async with env.unit_of_work() as uow:
+            user.full_name = "Admin Uow"
+            uow.update(user_model, user)
+            product.label = "Product5 Uow"
+            uow.update(product_model, product)
+    # the user is written before the conflict, the product is not
+    assert user.doc_version == version + 1
+    assert user.get_dirty_fields() == set()
+    assert product.get_dirty_fields() == {"label"}
+    user.full_name = full_name
+    res = await user_model.update(user)
+    assert res.doc_version == version + 2
+    await env.get_collection("prodotti").update_one(
+        {"rec_name": "prod5"}, {"$inc": {"doc_version": -1}}
+    )
+    product_model.versioned = False
+    await env.close_env()
+
+
+@pytestmark
+async def test_products_unit_of_work_transaction():
+    env = OzonEnv()
+    await env.init_env()
+    try:
+        hello = await env.db.engine.command("hello")
+    except Exception:
+        hello = {}
+    if not hello.get("setName"):
+        await env.close_env()
+        pytest.skip("transactions require a replica set")
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    product_model = env.get('prodotti')
+    async with env.unit_of_work(transaction=True) as uow:
+        uow.insert(
+            product_model,
+            await product_model.new({"rec_name": "uow_t0", "label": "T0"}),
+        )
+        uow.insert(
+            product_model,
+            await product_model.new({"rec_name": "prod1", "label": "Dup"}),
+        )
+    assert uow.fail is True
+    assert uow.results["prodotti"].inserted == 0
+    assert await product_model.count({"rec_name": "uow_t0"}) == 0
+    await env.close_env()
+
+
+@pytestmark
+async def test_products_write_profile():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    product_model = env.get('prodotti')
+    coll = product_model.get_collection("fast")
+    assert coll.write_concern.document == {"w": 1, "j": False}
+    assert product_model.get_collection("fast") is coll
+    assert product_model.get_collection() is not coll
+    with pytest.raises(ValueError):
+        product_model.get_collection("eventually")
+    product_model.write_profile = "fast"
+    assert product_model.get_collection() is coll
+    record = await product_model.new({"rec_name": "wp0", "label": "Wp0"})
+    record = await product_model.insert(record)
+    assert record.label == "Wp0"
+    record.label = "Wp0 Cache"
+    res = await product_model.update(record, write_profile="unacknowledged")
+    assert res is record
+    assert record.doc_version == 1
+    product = await product_model.load({"rec_name": "wp0"})
+    assert product.label == "Wp0 Cache"
+    await product_model.remove(product)
+    product_model.write_profile = ""
+    await env.close_env()
+
+
+@pytestmark
+async def test_products_status_many():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    product_model = env.get('prodotti')
+    records = [
+        await product_model.new({"rec_name": f"st{i}", "label": f"St{i}"})
+        for i in range(4)
+    ]
+    res = await product_model.insert_many(records)
+    assert res.inserted == 4
+    domain = {"rec_name": {"$regex": "^st"}}
+    res = await product_model.set_to_delete_many(domain)
+    assert res.matched == 4
+    assert res.modified == 4
+    assert await product_model.count(product_model.get_domain(domain)) == 0
+    assert await product_model.count_by_filter(
+        product_model.get_domain_archived(domain)
+    ) == 4
+    product = await product_model.load({"rec_name": "st0"})
+    assert product.is_to_delete()
+    assert product.doc_version == 1
+    assert product.update_uid == "admin"
+    res = await product_model.archive_many({"rec_name": "st0"})
+    assert res.matched == 1
+    product = await product_model.load({"rec_name": "st0"})
+    assert product.active is False
+    assert product.deleted == 0
+    res = await product_model.restore_many(domain)
+    assert res.matched == 4
+    assert await product_model.count(product_model.get_domain(domain)) == 4
+    await product_model.remove_all(domain)
+    await env.close_env()
+
+
+@pytestmark
+async def test_products_write_buffer():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    product_model = env.get('prodotti')
+    records = [
+        await product_model.new({"rec_name": f"wb{i}", "label": f"Wb{i}"})
+        for i in range(3)
+    ]
+    await product_model.insert_many(records)
+    product_model.enable_write_buffer(max_size=3, flush_interval=0)
+    coll = env.get_collection("prodotti")
+    record = records[0]
+    for i in range(5):
+        record.quantity = i
+        res = await product_model.update(record)
+        assert res is record
+    record.label = "Wb0 Total"
+    await product_model.update(record)
+    assert len(product_model.write_buffer) == 1
+    stored = await coll.find_one({"rec_name": "wb0"})
+    assert stored["quantity"] == 0
+    # read your writes
+    product = await product_model.load({"rec_name": "wb0"})
+    assert product.quantity == 4
+    assert product.label == "Wb0 Total"
+    assert product.doc_version == 1
+    assert len(product_model.write_buffer) == 0
+    # the reads of any model on the collection flush the buffer
+    record.quantity = 11
+    await product_model.update(record)
+    assert await product_model.count_by_filter(
+        {"rec_name": "wb0", "quantity": 11}
+    ) == 1
+    view_model = await env.add_model(
+        'wb_view', virtual=True, data_model='prodotti'
+    )
+    record.quantity = 12
+    await product_model.update(record)
+    rows = await view_model.find_raw({"rec_name": "wb0"})
+    assert rows[0]["quantity"] == 12
+    # a failed flush keeps the updates
+    record.quantity = 13
+    await product_model.update(record)
+    user_session = env.orm.user_session
+    env.orm.user_session = None
+    with pytest.raises(AttributeError):
+        await product_model.flush_writes()
+    env.orm.user_session = user_session
+    assert len(product_model.write_buffer) == 1
+    await product_model.flush_writes()
+    stored = await coll.find_one({"rec_name": "wb0"})
+    assert stored["quantity"] == 13
+    buffer = product_model.write_buffer
+    buffer.pending = {"wb1": {"quantity": 2}}
+    buffer.restore({"wb0": {"quantity": 1}, "wb1": {"quantity": 1, "x": 1}})
+    assert buffer.pending == {
+        "wb0": {"quantity": 1},
+        "wb1": {"quantity": 2, "x": 1},
+    }
+    buffer.pending = {}
+    # flush on size
+    for rec in records:
+        rec.price = 2.5
+        await product_model.update(rec)
+    assert len(product_model.write_buffer) == 0
+    assert product_model.write_buffer.result.matched == 3
+    # flush on time
+    product_model.write_buffer.flush_interval = 0.05
+    records[1].quantity = 7
+    await product_model.update(records[1])
+    await asyncio.sleep(0.2)
+    stored = await coll.find_one({"rec_name": "wb1"})
+    assert stored["quantity"] == 7
+    # flush on close
+    records[2].quantity = 9
+    await product_model.update(records[2])
+    await env.close_env()
+    stored = await coll.find_one({"rec_name": "wb2"})
+    assert stored["quantity"] == 9
+    await coll.delete_many({"rec_name": {"$regex": "^wb"}})
+
+
+@pytestmark
+async def test_products_find_iter():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    product_model = env.get('prodotti')
+    domain = product_model.get_domain()
+    products = await product_model.find(domain, sort="label:asc")
+    records = [
+        record async for record in product_model.find_iter(
+            domain, sort="label:asc", batch_size=2
+        )
+    ]
+    assert [r.rec_name for r in records] == [p.rec_name for p in products]
+    assert records[0].get_dict_json() == products[0].get_dict_json()
+    assert records[0].get_dirty_fields() == set()
+    rows = [
+        row async for row in product_model.find_iter(
+            domain, sort="label:asc", skip=1, limit=2, raw=True
+        )
+    ]
+    assert [row["rec_name"] for row in rows] == [
+        p.rec_name for p in products[1:3]
+    ]
+    assert "_id" in rows[0]
+    pipeline = [
+        {"$match": domain},
+        {"$group": {"_id": "$active", "count": {"$sum": 1}}},
+    ]
+    results = [
+        res async for res in product_model.aggregate_iter(
+            pipeline, batch_size=1
+        )
+    ]
+    assert len(results) == 1
+    assert results[0].count == len(products)
+    await env.close_env()
+
+
+@pytestmark
+async def test_products_trusted_read():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    product_model = env.get('prodotti')
+    domain = product_model.get_domain()
+    products = await product_model.find(domain, sort="list_order:asc")
+    trusted = await product_model.find(
+        domain, sort="list_order:asc", trusted=True
+    )
+    assert [p.get_dict_json() for p in trusted] == [
+        p.get_dict_json() for p in products
+    ]
+    assert isinstance(trusted[0].create_datetime, datetime)
+    product_model.trusted_read = True
+    product = await product_model.load({"rec_name": products[0].rec_name})
+    assert product.get_dict_json() == products[0].get_dict_json()
+    product.label = "Product Trusted"
+    assert product.get_dirty_fields() == {"label"}
+    records = [
+        r async for r in product_model.find_iter(domain, sort="label:asc")
+    ]
+    assert len(records) == len(products)
+    product_model.trusted_read = False
+    await env.close_env()
+
+
+@pytestmark
+async def test_products_find_fields():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    product_model = env.get('prodotti')
+    domain = product_model.get_domain()
+    products = await product_model.find(domain, sort="list_order:asc")
+    partials = await product_model.find(
+        domain, sort="list_order:asc", fields=["label", "price"]
+    )
+    assert [p.rec_name for p in partials] == [p.rec_name for p in products]
+    partial = partials[1]
+    assert partial.label == products[1].label
+    assert partial.price == products[1].price
+    assert partial.id == products[1].id
+    with pytest.raises(FieldNotLoaded) as exc:
+        partial.quantity
+    assert exc.value.field == "quantity"
+    assert isinstance(exc.value, AttributeError)
+    assert not hasattr(partial, "data_value")
+    assert set(partial.get_dict_json()) == {
+        "id", "rec_name", "doc_version", "label", "price"
+    }
+    # update writes only the assigned fields
+    partial.label = "Partial Label"
+    await product_model.update(partial)
+    product = await product_model.load({"rec_name": partial.rec_name})
+    assert product.label == "Partial Label"
+    assert product.quantity == products[1].quantity
+    product.label = products[1].label
+    await product_model.update(product)
+    users = await env.get('user').find({"uid": "admin"}, fields=["uid"])
+    assert users[0].uid == "admin"
+    await env.close_env()
+
+
+class Visit(BasicModel):
+    code: str
+    day: date = date(2024, 1, 1)
+
+
+@pytestmark
+async def test_find_fields_required():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    visit_model = await env.orm.add_static_model('visit', Visit)
+    # day2 is not in the stored format, the field is validated
+    await env.get_collection("visit").insert_many([
+        {"rec_name": "visit1", "code": "V1", "day": "2024-01-02"},
+        {"rec_name": "visit2", "code": "V2", "day": "2024-01-03T00:00:00"},
+    ])
+    visits = await visit_model.find(
+        {"rec_name": {"$in": ["visit1", "visit2"]}},
+        sort="rec_name:asc",
+        fields=["day"],
+    )
+    assert [v.day for v in visits] == [date(2024, 1, 2), date(2024, 1, 3)]
+    with pytest.raises(FieldNotLoaded):
+        visits[1].code
+    await env.get_collection("visit").drop()
+    await env.close_env()
+
+
+@pytestmark
+async def test_products_find_page():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    product_model = env.get('prodotti')
+    domain = product_model.get_domain()
+    # _id breaks the list_order ties as in find_page
+    products = await product_model.find(
+        domain, sort="list_order:desc,_id:desc"
+    )
+    page = await product_model.find_page(domain, limit=3)
+    assert not page.fail
+    assert page.cursor
+    names = [p.rec_name for p in page.records]
+    # an insert before the cursor does not shift the next pages
+    prod = await product_model.new(
+        {"rec_name": "page0", "label": "Page0", "price": "1.0"}
+    )
+    prod = await product_model.insert(prod)
+    while page.cursor:
+        page = await product_model.find_page(
+            domain, limit=3, cursor=page.cursor
+        )
+        assert not page.fail
+        assert len(page.records) <= 3
+        names.extend(p.rec_name for p in page.records)
+    assert names == [p.rec_name for p in products]
+    raw = await product_model.find_raw_page(
+        domain, sort="list_order:asc", limit=2, fields={"label": 1}
+    )
+    assert [r["label"] for r in raw.records] == [
+        p.label for p in products[::-1][:2]
+    ]
+    assert set(raw.records[0]) == {"_id", "label", "list_order"}
+    # null and missing sort values
+    coll = env.get_collection("prodotti")
+    await coll.insert_many(
+        [
+            {"rec_name": "pk0", "page_key": None},
+            {"rec_name": "pk1"},
+            {"rec_name": "pk2", "page_key": 2},
+            {"rec_name": "pk3", "page_key": 1},
+            {"rec_name": "pk4", "page_key": None},
+        ]
+    )
+    pk_domain = {"rec_name": {"$regex": "^pk"}}
+    for direction in [1, -1]:
+        sort = "page_key:asc" if direction == 1 else "page_key:desc"
+        expected = await coll.find(pk_domain).sort(
+            [("page_key", direction), ("_id", direction)]
+        ).to_list(length=None)
+        names = []
+        page = await product_model.find_raw_page(pk_domain, sort, limit=1)
+        names.extend(r["rec_name"] for r in page.records)
+        while page.cursor:
+            page = await product_model.find_raw_page(
+                pk_domain, sort, limit=1, cursor=page.cursor
+            )
+            names.extend(r["rec_name"] for r in page.records)
+        assert names == [r["rec_name"] for r in expected]
+    await coll.delete_many(pk_domain)
+    page = await product_model.find_page(domain, cursor="not a cursor")
+    assert page.fail
+    assert page.records == []
+    assert product_model.status.fail
+    await product_model.remove(prod)
+    await env.close_env()
+
+
+@pytestmark
+async def test_products_query_log():
+    env = OzonEnv()
+    await env.init_env()
+    await env.orm.add_static_model('user', User)
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    product_model = env.get('prodotti')
+    threshold_ms = query_log.threshold_ms
+    query_log.threshold_ms = 0
+    query_log.clear()
+    products = await product_model.find_raw(
+        {"rec_name": "prod1"}, sort="list_order:asc"
+    )
+    await product_model.count_by_filter({"active": True})
+    await product_model.distinct("rec_name", {"active": True})
+    await product_model.aggregate_raw([{"$match": {"rec_name": "prod1"}}])
+    entries = list(query_log.entries)
+    query_log.threshold_ms = threshold_ms
+    assert [e.operation for e in entries] == [
+        "find_raw", "count_by_filter", "distinct", "aggregate_raw"
+    ]
+    assert entries[0].model == "prodotti"
+    assert entries[0].shape == {"rec_name": "?"}
+    assert entries[0].sort == {"list_order": 1}
+    assert entries[0].docs == len(products) == 1
+    res = await product_model.explain({"rec_name": "prod1"})
+    assert not res.fail
+    assert res.index_used
+    assert "rec_name_1" in res.indexes
+    res = await product_model.explain({"label": "Prod1"}, sort="label:asc")
+    assert not res.fail
+    assert not res.index_used
+    assert "COLLSCAN" in res.stages
+    await env.close_env()
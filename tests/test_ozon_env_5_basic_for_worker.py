@@ -1,7 +1,11 @@
+import asyncio
 import locale
 import traceback
+from datetime import datetime, timedelta
 
-from ozonenv.OzonEnv import OzonWorkerEnv, OzonEnv, BasicReturn
+from ozonenv.OzonEnv import OzonWorkerEnv, OzonEnv, OzonEnvPool, BasicReturn
+from ozonenv.core.OzonOrm import OzonModel
+from ozonenv.core.cache.session_cache import session_cache
 from ozonenv.core.BaseModels import CoreModel
 from ozonenv.core.ModelMaker import MainModel
 from test_common import *
@@ -425,3 +429,324 @@ async def test_worker2_with_nested():
     assert res.data['test_topic']['model'] == "documento_beni_servizi"
     assert res.data['documento_beni_servizi']['stato'] == "caricato"
     await worker.close_env()
+
+
+@pytestmark
+async def test_worker_env_pool():
+    pool = OzonEnvPool(OzonWorkerEnv, size=1)
+    params = {
+        "current_session_token": "BA6BA930",
+        "topic_name": "test_topic",
+        "document_type": "standard",
+        "model": "",
+        "session_is_api": False,
+    }
+    res = await pool.make_app_session(params)
+    assert res.fail is False
+    env = pool.envs[0]
+    orm = env.orm
+    models = env.models
+    assert env.env_ready is True
+    assert env.user_session.uid == "admin"
+    row_model = env.get("riga_doc")
+    row_model.versioned = True
+    row_model.trusted_read = True
+    row_model.enable_write_buffer(flush_interval=0)
+    res = await pool.make_app_session(
+        {"current_session_token": "BA6B----", "topic_name": "test_topic"}
+    )
+    assert res.fail is True
+    assert env.user_session is None
+    # the options of the previous job are not kept
+    assert row_model.versioned is False
+    assert row_model.trusted_read is False
+    assert row_model.write_buffer is None
+    res = await pool.make_app_session(params)
+    assert res.fail is False
+    assert len(pool.envs) == 1
+    assert pool.envs[0] is env
+    assert env.orm is orm
+    assert env.models is models
+    assert env.user_session.uid == "admin"
+    await pool.close()
+    assert env.env_ready is False
+    assert pool.envs == []
+
+
+@pytestmark
+async def test_worker_env_pool_bootstrap_profile():
+    cfg = OzonWorkerEnv().config_system.copy()
+    cfg["bootstrap_profile"] = True
+    pool = OzonEnvPool(OzonWorkerEnv, size=1, cfg=cfg)
+    params = {
+        "current_session_token": "BA6BA930",
+        "topic_name": "test_topic",
+        "document_type": "standard",
+        "model": "",
+        "session_is_api": False,
+    }
+    res = await pool.make_app_session(params)
+    assert res.fail is False
+    report = res.data["bootstrap_profile"]
+    # the env is bootstrapped by the pool in the same request, the db
+    # connection is opened by the pool
+    for phase in ["orm_models", "db_models", "init_session"]:
+        assert phase in report["phases"]
+    res = await pool.make_app_session(params)
+    assert res.fail is False
+    report = res.data["bootstrap_profile"]
+    # a warm env profiles only the session
+    assert "db_models" not in report["phases"]
+    assert "init_session" in report["phases"]
+    await pool.close()
+
+
+@pytestmark
+async def test_worker_env_pool_connect_once(monkeypatch):
+    import ozonenv.OzonEnv as ozon_env
+
+    calls = []
+    connect_to_mongo = ozon_env.connect_to_mongo
+
+    async def count_connect(settings):
+        calls.append(settings)
+        await asyncio.sleep(0)
+        return await connect_to_mongo(settings)
+
+    monkeypatch.setattr(ozon_env, "connect_to_mongo", count_connect)
+    pool = OzonEnvPool(OzonWorkerEnv, size=2)
+    env1, env2 = await asyncio.gather(pool.get_env(), pool.get_env())
+    assert env1 is not env2
+    assert len(calls) == 1
+    pool.release_env(env1)
+    pool.release_env(env2)
+    await pool.close()
+
+
+@pytestmark
+async def test_lazy_models():
+    env = OzonEnv()
+    env.lazy_models = True
+    await env.init_env()
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    assert "riga_doc" in env.orm.lazy_models
+    assert "riga_doc" not in env.models
+    row_model = env.get("riga_doc")
+    assert row_model.name == "riga_doc"
+    assert "riga_doc" in env.models
+    assert "riga_doc" not in env.orm.lazy_models
+    assert env.get("riga_doc") is row_model
+    doc_model = env.models["documento_beni_servizi"]
+    assert doc_model.data_model == "documento"
+    rows = await row_model.find({"parent": "DOC99999"})
+    assert len(rows) > 0
+    assert env.get("not_a_model") is None
+    await env.close_env()
+
+
+@pytestmark
+async def test_init_db_models_concurrently():
+    env = OzonEnv()
+    await env.init_env()
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    # a collection without component and a model to rebuild
+    await env.get_collection("no_component").insert_one({"rec_name": "x"})
+    await env.orm.init_db_models_concurrently(
+        ["no_component", "riga_doc"],
+        {"riga_doc": "2999-01-01T00:00:00"},
+    )
+    assert "no_component" not in env.models
+    row_model = env.get("riga_doc")
+    assert row_model.name == "riga_doc"
+    rows = await row_model.find({"parent": "DOC99999"})
+    assert len(rows) > 0
+    await env.get_collection("no_component").drop()
+    await env.close_env()
+
+
+class InitModel(OzonModel):
+    async def init_model(self):
+        await super().init_model()
+        self.init_done = True
+
+
+@pytestmark
+async def test_lazy_models_init_model_hook():
+    env = OzonEnv(cls_model=InitModel)
+    env.lazy_models = True
+    await env.init_env()
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    # the async hook can not run on first access, built at init
+    assert env.orm.lazy_models == {}
+    assert "riga_doc" in env.models
+    assert env.get("riga_doc").init_done is True
+    await env.close_env()
+
+
+@pytestmark
+async def test_env_on_db_change():
+    env = OzonEnv()
+    await env.init_env()
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    settings = env.orm.app_settings
+    row_model = env.get("riga_doc")
+    db_settings = await env.get_collection("settings").find_one(
+        {"rec_name": "test"}
+    )
+    db_settings["delete_record_after_days"] = 5
+    await env.orm.on_change(
+        {
+            "operationType": "update",
+            "ns": {"coll": "settings"},
+            "fullDocument": db_settings,
+        }
+    )
+    assert env.orm.app_settings is settings
+    assert row_model.setting_app.delete_record_after_days == 5
+    await env.orm.on_change(
+        {
+            "operationType": "update",
+            "ns": {"coll": "component"},
+            "fullDocument": {"rec_name": "riga_doc"},
+        }
+    )
+    assert env.get("riga_doc") is not row_model
+    assert env.get("riga_doc").model is row_model.model
+    await env.close_env()
+
+
+@pytestmark
+async def test_env_watcher():
+    env = OzonEnv()
+    await env.init_env()
+    try:
+        hello = await env.db.engine.command("hello")
+    except Exception:
+        hello = {}
+    if not hello.get("setName"):
+        await env.close_env()
+        pytest.skip("change streams require a replica set")
+    env.start_watcher()
+    await asyncio.sleep(0.5)
+    await env.get_collection("settings").update_one(
+        {"rec_name": "test"}, {"$set": {"delete_record_after_days": 3}}
+    )
+    for i in range(50):
+        if env.orm.app_settings.delete_record_after_days == 3:
+            break
+        await asyncio.sleep(0.1)
+    assert env.orm.app_settings.delete_record_after_days == 3
+    await env.get_collection("settings").update_one(
+        {"rec_name": "test"}, {"$set": {"delete_record_after_days": 1}}
+    )
+    await env.close_env()
+    assert env.watcher_task is None
+
+
+@pytestmark
+async def test_worker_env_pool_notify_change():
+    pool = OzonEnvPool(OzonWorkerEnv, size=2)
+    env1, env2 = await asyncio.gather(pool.get_env(), pool.get_env())
+    settings = await env1.get_collection("settings").find_one(
+        {"rec_name": env1.orm.app_code}
+    )
+    settings["delete_record_after_days"] = 5
+    # one change stream notifies all the env of the pool
+    await pool.notify_change(
+        {"ns": {"coll": "settings"}, "fullDocument": settings}
+    )
+    assert env1.orm.app_settings.delete_record_after_days == 5
+    assert env2.orm.app_settings.delete_record_after_days == 5
+    assert env1.watcher_task is None
+    pool.release_env(env1)
+    pool.release_env(env2)
+    await pool.close()
+
+
+@pytestmark
+async def test_session_cache():
+    env = OzonEnv()
+    await env.init_env()
+    # the cache is opt-in
+    assert env.orm.session_cache_ttl == 0
+    env.orm.session_cache_ttl = 60
+    env.params = {"current_session_token": "BA6BA930"}
+    await env.session_app()
+    namespace = env.db.engine.name
+    # expired sessions are never cached
+    assert await session_cache.get(namespace, "BA6BA930") is None
+    expire_datetime = env.user_session.expire_datetime
+    await env.get_collection("session").update_one(
+        {"token": "BA6BA930"},
+        {
+            "$set": {
+                "rec_name": "BA6BA930",
+                "expire_datetime": datetime.now() + timedelta(hours=1),
+            }
+        },
+    )
+    await env.session_app()
+    cached = await session_cache.get(namespace, "BA6BA930")
+    assert cached.uid == "admin"
+    assert cached is not env.user_session
+    session_model = env.get("session")
+    session = await session_model.load({"token": "BA6BA930"})
+    session.full_name = "Admin Cached"
+    await session_model.update(session)
+    assert await session_cache.get(namespace, "BA6BA930") is None
+    await env.session_app()
+    assert env.user_session.full_name == "Admin Cached"
+    env.user_session.full_name = "changed"
+    await env.session_app()
+    assert env.user_session.full_name == "Admin Cached"
+    env.orm.session_cache_ttl = 0
+    await env.get_collection("session").update_one(
+        {"token": "BA6BA930"},
+        {
+            "$set": {"full_name": "Admin", "expire_datetime": expire_datetime},
+            "$unset": {"rec_name": ""},
+        },
+    )
+    await env.session_app()
+    assert env.user_session.full_name == "Admin"
+    await session_cache.invalidate(namespace, "BA6BA930")
+    await env.close_env()
+
+
+@pytestmark
+async def test_bootstrap_profile():
+    params = {
+        "current_session_token": "BA6BA930",
+        "topic_name": "test_topic",
+        "document_type": "standard",
+        "model": "documento_beni_servizi",
+        "session_is_api": False,
+    }
+    worker = OzonWorkerEnv()
+    res = await worker.make_app_session(params=params)
+    assert res.fail is False
+    assert "bootstrap_profile" not in res.data
+    assert worker.bootstrap_report == {}
+    worker = OzonWorkerEnv()
+    worker.profile_bootstrap = True
+    res = await worker.make_app_session(params=params)
+    assert res.fail is False
+    report = res.data["bootstrap_profile"]
+    assert report is worker.bootstrap_report
+    for phase in [
+        "connect_db",
+        "set_lang",
+        "collections_names",
+        "init_settings",
+        "orm_models",
+        "db_models",
+        "init_session",
+    ]:
+        assert float(report["phases"][phase]) >= 0
+    assert "session" in report["models"]
+    assert "riga_doc" in report["models"]
+    assert float(report["total"]) >= float(report["phases"]["db_models"])
@@ -1,4 +1,9 @@
-from ozonenv.core.BaseModels import DataReturn
+from datetime import date, datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from ozonenv.core.BaseModels import BasicModel, DataReturn
 
 
 class TestDataReturn:
@@ -41,3 +46,50 @@ class TestDataReturn:
         assert result.data is None
         assert result.fail is False
         assert result.msg == "No data"
+
+
+class Row(BaseModel):
+    amount: float = 0
+    day: Optional[date] = None
+
+
+class Doc(BasicModel):
+    label: str = ""
+    due_date: Optional[date] = None
+    rows: List[Row] = []
+
+
+DOC_DATA = {
+    "id": "6ad3de83465d8356f6220815",
+    "rec_name": "doc1",
+    "label": "Doc 1",
+    "create_datetime": "2024-01-02T03:04:05",
+    "due_date": "2024-02-01",
+    "rows": [{"amount": 1.5, "day": "2024-01-03"}],
+    "data_value": {"due_date": "01/02/2024"},
+}
+
+
+class TestModelConstructTrusted:
+    def test_same_as_validation(self):
+        """Test the trusted record is equal to the validated one"""
+        record = Doc.model_construct_trusted(DOC_DATA)
+        validated = Doc(**DOC_DATA)
+        assert record.model_dump() == validated.model_dump()
+        assert record.create_datetime == datetime(2024, 1, 2, 3, 4, 5)
+        assert record.due_date == date(2024, 2, 1)
+        assert isinstance(record.rows[0], Row)
+        assert record.id == "6ad3de83465d8356f6220815"
+
+    def test_data_not_changed(self):
+        """Test the data dict is not modified"""
+        data = DOC_DATA.copy()
+        Doc.model_construct_trusted(data)
+        assert data == DOC_DATA
+
+    def test_fallback_to_validation(self):
+        """Test a value not in the stored format is validated"""
+        data = DOC_DATA.copy()
+        data["due_date"] = "2024-02-01T00:00:00"
+        record = Doc.model_construct_trusted(data)
+        assert record.due_date == date(2024, 2, 1)
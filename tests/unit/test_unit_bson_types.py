@@ -0,0 +1,93 @@
+import datetime
+import json
+import math
+import random
+from collections import OrderedDict
+
+import bson
+import pytest
+from bson.decimal128 import Decimal128
+from bson.son import SON
+
+from ozonenv.core.db.BsonTypes import JsonEncoder, bson_to_python
+
+
+def json_round_trip(o):
+    return json.loads(json.dumps(o, cls=JsonEncoder, ensure_ascii=False))
+
+
+def make_doc():
+    return {
+        "_id": bson.ObjectId(),
+        "rec_name": "prod1",
+        "label": "Prodotto è",
+        "quantity": 3,
+        "price": 10.5,
+        "active": True,
+        "parent": None,
+        "tot": Decimal128("3.5"),
+        "big": bson.int64.Int64(2**40),
+        "create_datetime": datetime.datetime(2024, 1, 2, 3, 4, 5, 6),
+        "utc": datetime.datetime(2024, 1, 2, tzinfo=datetime.timezone.utc),
+        "day": datetime.date(2024, 1, 2),
+        "hour": datetime.time(1, 2, 3),
+        "elapsed": datetime.timedelta(minutes=5),
+        "nan": float("nan"),
+        "code": bson.code.Code("return 1"),
+        "app_code": ["test", ("a", 1)],
+        "rows": [{"row_id": bson.ObjectId(), "amount": Decimal128("-0.1")}],
+        "son": SON([("a", 1), ("b", Decimal128("1E+3"))]),
+        "ordered": OrderedDict(a=datetime.date(2024, 1, 1)),
+    }
+
+
+class TestBsonToPython:
+    def test_json_encoder_compat(self):
+        """Test bson_to_python returns the JsonEncoder round trip values"""
+        doc = make_doc()
+        res = bson_to_python(doc)
+        assert repr(res) == repr(json_round_trip(doc))
+        for key, value in json_round_trip(doc).items():
+            assert type(res[key]) is type(value)
+
+    def test_not_serializable(self):
+        """Test the not json types raise TypeError as JsonEncoder"""
+        for value in (bson.Binary(b"x"), b"x", bson.regex.Regex("^a")):
+            with pytest.raises(TypeError):
+                json_round_trip({"value": value})
+            with pytest.raises(TypeError):
+                bson_to_python({"value": value})
+
+    def test_decimal128_compat(self):
+        """Test Decimal128 values convert as float(to_decimal())"""
+        rnd = random.Random(1)
+        values = [
+            "0", "-0", "NaN", "-Infinity", "1E+6144", "1E-6176",
+            "1.7976931348623157E+308", "1.8E+308", "4.9E-324",
+            "9999999999999999999999999999999999E+6111",
+        ]
+        for _ in range(2000):
+            digits = rnd.randint(1, 34)
+            values.append(
+                f"{rnd.choice(['', '-'])}{rnd.randrange(10**digits)}"
+                f"E{rnd.randint(-400, 400)}"
+            )
+        for value in values:
+            expected = float(Decimal128(value).to_decimal())
+            res = bson_to_python(Decimal128(value))
+            if math.isnan(expected):
+                assert math.isnan(res)
+            else:
+                assert res == expected
+                assert math.copysign(1, res) == math.copysign(1, expected)
+
+    def test_large_find(self):
+        """Test the rows of a large find convert as the json round trip"""
+        rows = [make_doc() for _ in range(2000)]
+        originals = [repr(row) for row in rows]
+        res = [bson_to_python(row) for row in rows]
+        assert [repr(row) for row in res] == [
+            repr(json_round_trip(row)) for row in rows
+        ]
+        # the documents read from db are not changed
+        assert [repr(row) for row in rows] == originals
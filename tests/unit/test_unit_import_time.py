@@ -0,0 +1,52 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+# packages imported only when the feature that needs them is used
+DEFERRED_PACKAGES = [
+    "json_logic",
+    "babel",
+    "starlette",
+    "aiopath",
+    "motor",
+    "redis",
+    "dateutil",
+    "httpx",
+]
+# import ozonenv.OzonEnv budget in microseconds, measured ~0.4s
+IMPORT_TIME_BUDGET_US = 1_500_000
+
+
+def run_python(*args):
+    return subprocess.run(
+        [sys.executable, *args],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).parents[2],
+    )
+
+
+class TestImportTime:
+    def test_heavy_dependencies_deferred(self):
+        """Test import ozonenv does not load the deferred packages"""
+        res = run_python(
+            "-c",
+            "import sys, json, ozonenv.OzonEnv; "
+            "print(json.dumps(sorted(sys.modules)))",
+        )
+        modules = json.loads(res.stdout)
+        loaded = [m for m in modules if m.split(".")[0] in DEFERRED_PACKAGES]
+        assert loaded == []
+
+    def test_import_time_budget(self):
+        """Test import ozonenv.OzonEnv within the import time budget"""
+        res = run_python("-X", "importtime", "-c", "import ozonenv.OzonEnv")
+        line = [
+            row
+            for row in res.stderr.splitlines()
+            if row.endswith("| ozonenv.OzonEnv")
+        ][-1]
+        cumulative = int(line.split("|")[1])
+        assert cumulative < IMPORT_TIME_BUDGET_US
@@ -0,0 +1,121 @@
+import time
+
+from ozonenv.core.db.QueryLog import (
+    QueryLog,
+    plan_summary,
+    query_shape,
+    winning_plan,
+)
+
+IXSCAN_PLAN = {
+    "stage": "LIMIT",
+    "inputStage": {
+        "stage": "FETCH",
+        "inputStage": {"stage": "IXSCAN", "indexName": "rec_name_1"},
+    },
+}
+OR_PLAN = {
+    "stage": "SUBPLAN",
+    "inputStage": {
+        "stage": "OR",
+        "inputStages": [
+            {"stage": "IXSCAN", "indexName": "a_1"},
+            {"stage": "COLLSCAN"},
+        ],
+    },
+}
+
+
+class TestQueryShape:
+    def test_values_redacted(self):
+        """Test the domain values are replaced keeping fields and operators"""
+        domain = {
+            "active": True,
+            "price": {"$gt": 10, "$lt": 20},
+            "$or": [{"rec_name": "prod1"}, {"tags": {"$in": ["a", "b"]}}],
+        }
+        assert query_shape(domain) == {
+            "active": "?",
+            "price": {"$gt": "?", "$lt": "?"},
+            "$or": [{"rec_name": "?"}, {"tags": {"$in": "?"}}],
+        }
+
+    def test_pipeline(self):
+        """Test a pipeline keeps the stages"""
+        pipeline = [{"$match": {"uid": "admin"}}, {"$limit": 3}]
+        assert query_shape(pipeline) == [
+            {"$match": {"uid": "?"}},
+            {"$limit": "?"},
+        ]
+
+
+class TestPlanSummary:
+    def test_index_scan(self):
+        """Test stages and indexes of a nested plan"""
+        assert plan_summary(IXSCAN_PLAN) == (
+            ["LIMIT", "FETCH", "IXSCAN"],
+            ["rec_name_1"],
+        )
+
+    def test_input_stages(self):
+        """Test the plan branches are visited in order"""
+        assert plan_summary(OR_PLAN) == (
+            ["SUBPLAN", "OR", "IXSCAN", "COLLSCAN"],
+            ["a_1"],
+        )
+
+    def test_winning_plan(self):
+        """Test the winning plan of classic, sbe and sharded explain"""
+        assert winning_plan({"queryPlanner": {"winningPlan": OR_PLAN}}) == (
+            OR_PLAN
+        )
+        sbe = {"queryPlanner": {"winningPlan": {"queryPlan": OR_PLAN}}}
+        assert winning_plan(sbe) == OR_PLAN
+        sharded = {
+            "queryPlanner": {
+                "winningPlan": {
+                    "stage": "SINGLE_SHARD",
+                    "shards": [{"winningPlan": IXSCAN_PLAN}],
+                }
+            }
+        }
+        assert winning_plan(sharded) == IXSCAN_PLAN
+        assert winning_plan({}) == {}
+
+
+class TestQueryLog:
+    def test_threshold(self):
+        """Test only the queries over the threshold are recorded"""
+        log = QueryLog(threshold_ms=50)
+        log.record("prodotti", "find_raw", {"a": 1}, time.monotonic())
+        assert len(log.entries) == 0
+        log.record(
+            "prodotti",
+            "find_raw",
+            {"a": 1},
+            time.monotonic() - 0.1,
+            docs=3,
+            sort={"a": 1},
+        )
+        entry = log.entries[0]
+        assert entry.model == "prodotti"
+        assert entry.shape == {"a": "?"}
+        assert entry.sort == {"a": 1}
+        assert entry.docs == 3
+        assert entry.duration_ms >= 100
+
+    def test_disabled(self):
+        """Test a negative threshold disables the log"""
+        log = QueryLog(threshold_ms=-1)
+        assert not log.enabled
+        log.record("prodotti", "distinct", {}, time.monotonic() - 1)
+        assert len(log.entries) == 0
+
+    def test_maxsize(self):
+        """Test only the last maxsize queries are kept"""
+        log = QueryLog(threshold_ms=0, maxsize=2)
+        for i in range(3):
+            log.record("prodotti", f"q{i}", {}, time.monotonic())
+        assert [e.operation for e in log.entries] == ["q1", "q2"]
+        log.clear()
+        assert len(log.entries) == 0